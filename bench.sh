@@ -0,0 +1,8 @@
+#!/bin/sh
+
+source ./venv/bin/activate
+
+# Usage: ./bench.sh <tick|render> [options]
+name=$1
+shift
+PYTHONPATH=src/ python "benchmarks/$name.py" "$@"
@@ -0,0 +1,237 @@
+"""
+Microbenchmarks for each stage of the render pipeline
+
+Times the text helpers, masking, every piece generator, the graph template and output encoding with fixed inputs:
+images are generated locally instead of fetched from the CDN, and text mixes Latin, CJK and emoji so the Noto
+fallback path is exercised. Caches that would hide the cost of a stage are cleared before every round
+
+Usage:
+    PYTHONPATH=src python benchmarks/render.py --save benchmarks/render_baseline.json
+    PYTHONPATH=src python benchmarks/render.py --compare benchmarks/render_baseline.json
+"""
+
+import sys
+import json
+import time
+import argparse
+import datetime
+import statistics
+from io import BytesIO
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw
+from discord import Colour, Status
+
+from redqct.lib.image import (
+    BANNERS,
+    CROPPED,
+    TEXT_WIDTHS,
+    Cache,
+    ActivitySpec,
+    SpecsSpec,
+    coverage,
+    cropped,
+    draw_legend_entry,
+    draw_text,
+    generate_activity,
+    generate_empty_graph,
+    generate_member,
+    masked,
+    render_specs,
+    stitch,
+    truncate,
+)
+from redqct.lib.encode import GRAPH, SPECS
+
+
+# Latin, CJK, emoji and a mix of all three, in roughly the lengths real names and activities come in
+TEXTS = [
+    "Tom Clancy's Rainbow Six Siege - Ranked",
+    "原神 Genshin Impact",
+    "🎮 grinding ranked 🔥🔥",
+    "YOASOBI - アイドル (Idol) 🎤 feat. 東京 Tokyo",
+]
+LONG_TEXT = " | ".join(TEXTS) * 3
+
+
+def fixture_png(size: int, seed: int) -> bytes:
+    """
+    A deterministic noisy gradient, standing in for an avatar or album cover fetched from the CDN
+    """
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(0, 255, size, dtype=np.float32)
+    pixels = np.stack(
+        [np.add.outer(ramp, ramp) / 2, np.tile(ramp, (size, 1)), np.tile(ramp[:, None], (1, size))], 2
+    )
+    pixels += rng.normal(0, 12, pixels.shape)
+
+    with BytesIO() as bin:
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB").save(bin, "png")
+        return bin.getvalue()
+
+
+AVATAR = fixture_png(512, 1)
+COVER = fixture_png(300, 2)
+ICON = fixture_png(64, 3)
+
+
+def clear_caches() -> None:
+    """
+    Forgets everything the render helpers have memoised, so a round measures the work rather than a lookup
+    """
+    truncate.cache_clear()
+    coverage.cache_clear()
+    TEXT_WIDTHS.clear()
+    BANNERS.clear()
+    CROPPED.clear()
+
+
+class Case(NamedTuple):
+    name: str
+    run: Callable[[], object]
+    # Run untimed before every round
+    setup: Callable[[], None] = clear_caches
+
+
+def cases() -> List[Case]:
+    avatar = cropped(AVATAR, "pfp_mask")
+    cover = cropped(COVER, "activity_mask")
+    icon = cropped(ICON, "status_mask")
+    decoded = Image.open(BytesIO(AVATAR))
+    decoded.load()
+
+    canvas = Image.new("RGBA", (1300, 60))
+    interface = ImageDraw.Draw(canvas)
+    graph = generate_empty_graph("member", "0001", datetime.datetime(2022, 11, 20), 10, 30)
+
+    member = lambda: generate_member("名前 name 🎮", "0001", "nick ニック", Status.online, avatar, Colour(0x5865F2))
+    activity = lambda: generate_activity(cover, icon, "listening", *TEXTS)
+    pieces = [member(), activity(), activity(), activity()]
+    specs = stitch(pieces)
+
+    spec = SpecsSpec(
+        name="名前 name 🎮",
+        tag="0001",
+        nick="nick ニック",
+        status="online",
+        avatar=AVATAR,
+        banner_colour=(88, 101, 242),
+        custom_activity=LONG_TEXT,
+        activities=[ActivitySpec("listening", COVER, ICON, (TEXTS[0], TEXTS[1], TEXTS[2], TEXTS[3]))] * 2,
+    )
+
+    return [
+        Case(
+            "draw_text",
+            lambda: [
+                draw_text(interface, t, (255, 255, 255), (0, 10), Cache.bold_30, Cache.noto_30) for t in TEXTS
+            ],
+        ),
+        Case(
+            "truncate", lambda: [truncate(LONG_TEXT[i:], 335, Cache.bold_30, Cache.noto_30) for i in range(8)]
+        ),
+        Case("masked", lambda: masked(decoded, Cache.pfp_mask)),
+        Case("cropped", lambda: cropped(AVATAR, "pfp_mask")),
+        Case("generate_member", member),
+        Case("generate_activity", activity),
+        Case("stitch", lambda: stitch(pieces)),
+        Case(
+            "generate_empty_graph",
+            lambda: generate_empty_graph("名前 🎮", "0001", datetime.datetime(2022, 11, 20), 10, 30),
+        ),
+        Case(
+            "draw_legend_entry",
+            lambda: [
+                draw_legend_entry(graph, (238, 109, 166), t, (1460, 200 + 50 * i))
+                for i, t in enumerate(TEXTS)
+            ],
+        ),
+        Case("render_specs", lambda: render_specs(spec)),
+        Case("encode_graph", lambda: GRAPH.encode(graph)),
+        Case("encode_specs", lambda: SPECS.encode(specs)),
+    ]
+
+
+def measure(case: Case, rounds: int, warmup: int) -> Dict[str, float]:
+    timings: List[float] = []
+
+    for i in range(warmup + rounds):
+        case.setup()
+        start = time.perf_counter()
+        case.run()
+        if i >= warmup:
+            timings.append(time.perf_counter() - start)
+
+    return {
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "mean_ms": statistics.fmean(timings) * 1000,
+        "stdev_ms": (statistics.stdev(timings) if len(timings) > 1 else 0.0) * 1000,
+        "rounds": rounds,
+    }
+
+
+def compare(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float
+) -> bool:
+    """
+    Prints each stage's median against the baseline's, returning False if any got slower by more than `tolerance`
+    """
+    ok = True
+    print(f"{'stage':<22}{'baseline':>12}{'now':>12}{'change':>10}")
+
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<22}{'-':>12}{result['median_ms']:>10.2f}ms{'new':>10}")
+            continue
+
+        before, now = baseline[name]["median_ms"], result["median_ms"]
+        change = (now - before) / before
+        regressed = change > tolerance
+        ok = ok and not regressed
+        print(f"{name:<22}{before:>10.2f}ms{now:>10.2f}ms{change:>+9.1%}{' !' if regressed else ''}")
+
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20, help="timed rounds per stage")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed rounds per stage before timing starts")
+    parser.add_argument("--only", metavar="STAGE", action="append", help="only run the given stage(s)")
+    parser.add_argument("--save", metavar="PATH", help="write the results to PATH as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare the results against the baseline at PATH")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.10, help="slowdown allowed by --compare (0.10 = 10%%)"
+    )
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, float]] = {}
+    for case in cases():
+        if args.only and case.name not in args.only:
+            continue
+        results[case.name] = measure(case, args.rounds, args.warmup)
+
+    baseline: Optional[Dict[str, Dict[str, float]]] = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["stages"]
+
+    if baseline is None:
+        print(f"{'stage':<22}{'median':>12}{'min':>12}{'stdev':>12}")
+        for name, result in results.items():
+            print(
+                f"{name:<22}{result['median_ms']:>10.2f}ms{result['min_ms']:>10.2f}ms{result['stdev_ms']:>10.2f}ms"
+            )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": sys.version.split()[0], "stages": results}, f, indent=2)
+
+    if baseline is not None and not compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
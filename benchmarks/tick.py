@@ -0,0 +1,152 @@
+"""
+Benchmarks the minute tick against a synthetic guild
+
+Fakes a discord.Client and a guild of N tracked members whose games change at random, then drives
+`Users_.update_graphs` through simulated days as fast as it can. Day boundaries (`check_clear`) and new legend
+entries (`check_new_entry`) happen naturally along the way. Reports per tick latency percentiles, bytes written and
+peak RSS
+
+Usage: PYTHONPATH=src python benchmarks/tick.py --users 1000 --days 1 --churn 0.05 --storage files
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import resource
+import tempfile
+from typing import Dict, List
+
+import discord
+
+os.environ.setdefault("BOT_GUILD", "1")
+os.environ.setdefault("TICK_WORKERS", "8")
+
+from redqct.lib.track import Users_, BOT_GUILD, PRESETS
+from redqct.lib.storage import Storage, DirectoryStorage, SQLiteStorage
+from redqct.fakes import FakeClient
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def written_bytes() -> int:
+    """
+    Bytes this process has passed to write calls so far (Linux only; 0 elsewhere)
+    """
+    try:
+        with open("/proc/self/io", "r") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("wchar:"))
+    except (OSError, StopIteration):
+        return 0
+
+
+def disk_usage(directory: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names
+    )
+
+
+def open_backend(kind: str, directory: str) -> Storage:
+    if kind == "sqlite":
+        return SQLiteStorage(f"{directory}/redqct.db")
+    return DirectoryStorage(directory)
+
+
+async def simulate(args: argparse.Namespace, directory: str) -> Dict[str, float]:
+    rng = random.Random(args.seed)
+    client = FakeClient(BOT_GUILD, range(1, args.users + 1))
+    users = Users_(bot=client, storage=open_backend(args.storage, directory))
+
+    # Presets plus made up games, so legends fill up past the presets into DISTINCTS and random colours
+    games = list(PRESETS) + [f"Game {i}" for i in range(args.games)]
+
+    for member in client.guild.members.values():
+        # Spread members over real world offsets so their midnights don't all land on the same tick
+        users.track(str(member.id), rng.randint(-12, 14), rng.choice([0, 0, 0, 30]))
+
+    start = datetime.datetime(2022, 11, 20)
+    ticks = int(args.days * 1440)
+
+    # Stores are created for each member's real current day, so the first simulated tick would roll every one of
+    # them over, rendering a yesterday graph each and skewing the percentiles. Start them on the simulated day
+    for user in users.users.values():
+        user.store.reset(user.local_now(start).date())
+    durations: List[float] = []
+    written = written_bytes()
+    began = time.perf_counter()
+
+    for i in range(ticks):
+        minute = start + datetime.timedelta(minutes=i)
+
+        # Churn happens on the event loop between ticks, like real presence updates
+        for member in client.guild.members.values():
+            if rng.random() < args.churn:
+                count = rng.choice([0, 0, 1, 1, 1, 2])
+                member.activities = [discord.Game(name=name) for name in rng.sample(games, count)]
+                users.on_presence_update(member)
+
+        tick_start = time.perf_counter()
+        users.update_graphs([minute])
+        assert users.ticker.task
+        await users.ticker.task
+        durations.append(time.perf_counter() - tick_start)
+
+    total = time.perf_counter() - began
+    users.close()
+
+    return {
+        "users": args.users,
+        "ticks": ticks,
+        "total_s": total,
+        "p50_ms": percentile(durations, 50) * 1000,
+        "p90_ms": percentile(durations, 90) * 1000,
+        "p99_ms": percentile(durations, 99) * 1000,
+        "max_ms": max(durations) * 1000,
+        "mean_ms": sum(durations) / len(durations) * 1000,
+        "over_budget": sum(d > users.ticker.budget for d in durations),
+        "failures": users.ticker.failures,
+        "written_bytes": written_bytes() - written,
+        "disk_bytes": disk_usage(directory),
+        # Kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=500, help="number of tracked members")
+    parser.add_argument("--days", type=float, default=1.0, help="simulated days (1440 ticks each)")
+    parser.add_argument(
+        "--churn", type=float, default=0.05, help="chance a member's games change each minute"
+    )
+    parser.add_argument(
+        "--games", type=int, default=300, help="number of made up games on top of the presets"
+    )
+    parser.add_argument("--storage", choices=["files", "sqlite"], default="files")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="redqct-bench-") as directory:
+        results = asyncio.run(simulate(args, directory))
+
+    for key, value in results.items():
+        print(f"{key:>14} {value:.2f}" if isinstance(value, float) else f"{key:>14} {value}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    # Fail loudly (e.g. in CI) if a tick stopped fitting in its minute
+    sys.exit(1 if results["over_budget"] or results["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+from src.redqct.lib.namemap import build_namemap, DETECTABLE_PATH, NAMEMAP_PATH, INDEX_PATH
+
+
+def main() -> None:
+    added, changed, removed = build_namemap(DETECTABLE_PATH, NAMEMAP_PATH, INDEX_PATH)
+
+    if added or changed or removed:
+        print(f"Rebuilt namemap: {added} added, {changed} changed, {removed} removed")
+    else:
+        print("Namemap is already up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import asyncio
 
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from .lib import cube
 from .bot import bot, main
+from .lib.http import Session
+from .lib.metrics import REGISTRY
 
 
 server = FastAPI()
@@ -18,4 +21,16 @@ async def kanye_route():
     await bot.get_channel(1042389563009683496).send("Somebody just did a GET request @ 127.0.0.1:8000/kanye")
 
 
+@server.get("/metrics", response_class=PlainTextResponse)
+async def metrics_route():
+    # Prometheus text exposition format
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@server.on_event("shutdown")
+async def shutdown():
+    # Close the pooled CDN connections along with the server
+    await Session.close()
+
+
 asyncio.create_task(main())
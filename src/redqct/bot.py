@@ -1,18 +1,26 @@
 import io
+import time
+import logging
+import asyncio
 import os
 import discord
-from typing import Optional
+from typing import Dict, Optional
 from .lib import MemberAttrs, ActivityAttrs, NAMEMAP
-from .lib.track import Users_
-from .lib.image import generate_img
+from .lib.track import Users_, GRAPHS
+from .lib.schedule import MinuteScheduler
+from .lib.http import Session, RemoteCache
+from .lib.image import generate_img, Renderer
+from .lib.metrics import REGISTRY
+from .lib.log import Logging
+from .lib.encode import GRAPH, SPECS
 from discord.ext.commands import Bot, Context
-from discord.ext import tasks
 from dotenv import load_dotenv
-from pathlib import Path
-from PIL import Image
 import datetime
 
 load_dotenv()
+Logging.setup()
+logger = logging.getLogger(__name__)
+
 # Set this in .env
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 # BOT_TOKEN = os.getenv("DEV_TOKEN")
@@ -23,23 +31,97 @@ BOT_GUILD = int(bot_guild)
 
 intents = discord.Intents().all()
 bot = Bot(command_prefix="$", intents=intents)
+Users = Users_(bot=bot)
+Scheduler = MinuteScheduler(Users.update_graphs)
+
+COMMAND_SECONDS = REGISTRY.histogram(
+    "redqct_command_seconds", "Time taken to handle each command", ("command",)
+)
+COMMANDS = REGISTRY.counter(
+    "redqct_commands_total", "Commands handled, by whether they failed", ("command", "outcome")
+)
+# When each command currently being handled started, keyed by the id of its message
+command_starts: Dict[int, float] = {}
+
+# Counts the scheduler, ticker, journal and caches already keep, read whenever /metrics is scraped
+REGISTRY.callback("redqct_tracked_users", "Members currently being tracked", lambda: len(Users.users))
+REGISTRY.callback(
+    "redqct_scheduler_ticks_total", "Minutes the scheduler has fired", lambda: Scheduler.ticks, "counter"
+)
+REGISTRY.callback(
+    "redqct_scheduler_missed_total",
+    "Minutes caught up after the scheduler woke late",
+    lambda: Scheduler.missed,
+    "counter",
+)
+REGISTRY.callback(
+    "redqct_scheduler_lag_seconds", "How late the scheduler last woke up", lambda: Scheduler.lag
+)
+REGISTRY.callback("redqct_ticks_total", "Ticks run", lambda: Users.ticker.ticks, "counter")
+REGISTRY.callback(
+    "redqct_ticks_coalesced_total",
+    "Ticks folded into the next one",
+    lambda: Users.ticker.coalesced,
+    "counter",
+)
+REGISTRY.callback(
+    "redqct_tick_overruns_total", "Ticks over their budget", lambda: Users.ticker.overruns, "counter"
+)
+REGISTRY.callback(
+    "redqct_tick_failures_total", "Tick jobs that raised", lambda: Users.ticker.failures, "counter"
+)
+REGISTRY.callback(
+    "redqct_legend_writes_total", "Legends saved by the journal", lambda: Users.journal.writes, "counter"
+)
+REGISTRY.callback(
+    "redqct_cache_hits_total",
+    "Lookups answered by an in-memory cache",
+    lambda: {("graphs",): GRAPHS.hits, ("remote",): RemoteCache.memory.hits},
+    "counter",
+    ("cache",),
+)
+REGISTRY.callback(
+    "redqct_cache_misses_total",
+    "Lookups an in-memory cache couldn't answer",
+    lambda: {("graphs",): GRAPHS.misses, ("remote",): RemoteCache.memory.misses},
+    "counter",
+    ("cache",),
+)
 
 
 @bot.event
 async def on_ready():
-    print(f"Logged in as {bot.user}")
-    global Users
-    Users = Users_(bot=bot)
+    logger.info("Logged in as %s", bot.user)
     Users.load_existing()
-    task_loop.start()
+    Scheduler.start()
+
+
+@bot.event
+async def on_presence_update(before: discord.Member, after: discord.Member):
+    Users.on_presence_update(after)
+
 
+@bot.event
+async def on_member_remove(member: discord.Member):
+    if member.guild.id == BOT_GUILD and Users.exists(member.id):
+        # Stop tracking members that leave the server
+        Users.untrack(member.id)
+
+
+@bot.before_invoke
+async def before_command(ctx: Context):
+    command_starts[ctx.message.id] = time.perf_counter()
+
+
+@bot.after_invoke
+async def after_command(ctx: Context):
+    # Called whether or not the command raised
+    if (start := command_starts.pop(ctx.message.id, None)) is None:
+        return
 
-@tasks.loop(seconds=1)
-async def task_loop():
-    s = datetime.datetime.utcnow().second
-    if s == 0:
-        # A new minute
-        await Users.update_graphs()
+    name = ctx.command and ctx.command.qualified_name or "unknown"
+    COMMAND_SECONDS.observe(time.perf_counter() - start, name)
+    COMMANDS.inc(name, ctx.command_failed and "failed" or "ok")
 
 
 # command for just testing random stuff
@@ -300,7 +382,22 @@ async def show_tracked(ctx: Context):
     if not ctx.author.id in [565054806083895306, 703204753743806585]:
         return
 
-    await ctx.send(str(Users.users))
+    await ctx.send(str(list(Users.users.values())))
+
+
+@bot.command()
+async def tick_stats(ctx: Context):
+    # Only allow myself and @VladP1234 to use this command
+    if not ctx.author.id in [565054806083895306, 703204753743806585]:
+        return
+
+    ticker = Users.ticker
+    await ctx.send(
+        f"""
+        Scheduler: {Scheduler.ticks} ticks, {Scheduler.missed} missed minutes caught up, lag {Scheduler.lag:.3f}s (max {Scheduler.max_lag:.3f}s)
+        Ticker: {ticker.ticks} ticks, {ticker.coalesced} coalesced, {ticker.overruns} overruns, {ticker.failures} failed jobs, last {ticker.last_duration:.3f}s (max {ticker.max_duration:.3f}s)
+        """.strip()
+    )
 
 
 @bot.command()
@@ -330,12 +427,10 @@ async def specs(ctx: Context, member: Optional[discord.Member] = None):
     assert isinstance(ctx.author, discord.Member)
     member = member or ctx.author
 
-    img = await specs_img(member)
+    encoded = await specs_img(member)
 
-    with io.BytesIO() as bin:
-        img.save(bin, "png")
-        bin.seek(0)
-        await ctx.reply(file=discord.File(fp=bin, filename="out.png"))
+    with io.BytesIO(encoded) as bin:
+        await ctx.reply(file=discord.File(fp=bin, filename=SPECS.filename))
 
 
 @bot.command()
@@ -365,7 +460,11 @@ async def graph(ctx: Context, member: Optional[discord.Member] = None):
     assert isinstance(ctx.author, discord.Member)
     member = member or ctx.author
 
-    if not Users.exists(member.id):
+    tracked = Users.get(member.id)
+    # The member can be untracked while their graph is being rendered, in which case there's nothing to show
+    png = tracked and await asyncio.to_thread(tracked.graph_png)
+
+    if not png:
         embed = discord.Embed(
             title="Command failed",
             description="Cannot view the graph of an untracked user",
@@ -374,14 +473,13 @@ async def graph(ctx: Context, member: Optional[discord.Member] = None):
         await ctx.reply(embed=embed)
         return
 
-    graph_path = f"{Path(__file__).resolve().parents[2]}/data/{member.id}/graph_today.png"
-
-    await ctx.reply(file=discord.File(fp=graph_path, filename="out.png"))
+    with io.BytesIO(png) as bin:
+        await ctx.reply(file=discord.File(fp=bin, filename=GRAPH.filename))
 
 
-async def specs_img(member: discord.Member) -> Image.Image:
+async def specs_img(member: discord.Member) -> bytes:
     """
-    Extracts current specs of a user and generates an image
+    Extracts current specs of a user and generates an image, encoded with the `SPECS` profile
     """
     member_name = member.name
     member_tag = member.discriminator
@@ -578,8 +676,8 @@ async def specs_img(member: discord.Member) -> Image.Image:
         banner_colour=member_banner_colour,
     )
 
-    img = await generate_img(attrs)
-    return img
+    png = await generate_img(attrs)
+    return png
 
 
 async def main():
@@ -587,3 +685,10 @@ async def main():
         await bot.start(BOT_TOKEN)
     except KeyboardInterrupt:
         await bot.close()
+    finally:
+        # Otherwise the scheduler keeps firing into a closed ticker while the web server stays up
+        Scheduler.stop()
+        await Session.close()
+        Renderer.shutdown()
+        # Don't lose anything written since the last tick
+        Users.close()
@@ -0,0 +1,61 @@
+from typing import Dict, Iterable, List, Optional
+
+import discord
+
+
+# Stand-ins for the parts of discord.py the tracker touches, shared by the tests and benchmarks/tick.py
+
+
+class FakeUser:
+    __slots__ = ("id", "name", "discriminator")
+
+    def __init__(self, id: int) -> None:
+        self.id = id
+        self.name = f"member{id}"
+        self.discriminator = f"{id % 10000:04}"
+
+
+class FakeMember:
+    __slots__ = ("id", "guild", "activities")
+
+    def __init__(self, id: int, guild: "FakeGuild") -> None:
+        self.id = id
+        self.guild = guild
+        self.activities: List[discord.Game] = []
+
+
+class FakeGuild:
+    __slots__ = ("id", "members")
+
+    def __init__(self, id: int) -> None:
+        self.id = id
+        self.members: Dict[int, FakeMember] = {}
+
+    def get_member(self, id: int) -> Optional[FakeMember]:
+        return self.members.get(id)
+
+
+class FakeClient:
+    """
+    Just enough of a discord.Client for `Users_` and `TrackedUser`
+    """
+
+    __slots__ = ("guild", "users")
+
+    def __init__(self, guild: int, members: Iterable[int]) -> None:
+        """
+        guild   | id of the only guild, i.e. BOT_GUILD
+        members | ids of the guild's members
+        """
+        self.guild = FakeGuild(guild)
+        self.users: Dict[int, FakeUser] = {}
+
+        for id in members:
+            self.guild.members[id] = FakeMember(id, self.guild)
+            self.users[id] = FakeUser(id)
+
+    def get_guild(self, id: int) -> Optional[FakeGuild]:
+        return self.guild if id == self.guild.id else None
+
+    def get_user(self, id: int) -> Optional[FakeUser]:
+        return self.users.get(id)
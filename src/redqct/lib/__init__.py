@@ -1,20 +1,12 @@
 from __future__ import annotations
 from typing import Optional, List
 from discord import Status, Colour
-import json
 
-with open("namemap.json", "r") as f:
-    """
-    NAMEMAP is in this structure:
-    {
-        "game_name": {
-            "application_id": str
-            "icon_hash": Optional[str]
-        },
-        ...
-    }
-    """
-    NAMEMAP: dict[str, dict[str, Optional[str]]] = json.load(f)
+from .namemap import NameMap_, INDEX_PATH, NAMEMAP_PATH
+
+# Maps game names (and aliases and executables) to {"application_id": str, "icon_hash": Optional[str]}
+# The index is only opened on the first lookup; run build_namemap.py to refresh it after updating detectable.json
+NAMEMAP = NameMap_(INDEX_PATH, NAMEMAP_PATH)
 
 
 class MemberAttrs:
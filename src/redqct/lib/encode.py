@@ -0,0 +1,120 @@
+import os
+import zlib
+from io import BytesIO
+from typing import Iterable, List, Tuple
+import numpy as np
+from PIL import Image
+
+
+# zlib level for PNGs: 1 is several times cheaper than Pillow's default of 6 for a few more KB
+PNG_LEVEL = int(os.getenv("PNG_LEVEL", 1))
+# Whether graphs are quantised to a 256 colour palette before being encoded, making the PNG smaller and much faster
+# to encode. Quantising is lossy: the template's antialiased text has a few hundred colours, which shift by up to
+# ~15 levels. Legend colours are passed as `keep` and come out exact, so the bars and legend keys never change
+GRAPH_PALETTE = os.getenv("GRAPH_PALETTE", "1") == "1"
+# Format of `$specs` replies: "png", or "webp" (lossless) which is both smaller and faster to encode
+SPECS_FORMAT = os.getenv("SPECS_FORMAT", "png")
+
+
+class Profile:
+    """
+    How an image is encoded before being saved or uploaded
+    """
+
+    __slots__ = ("format", "level", "palette")
+
+    def __init__(self, format: str = "png", level: int = PNG_LEVEL, palette: bool = False) -> None:
+        """
+        format  | "png" or "webp"
+        level   | zlib level for PNGs, 0-9
+        palette | quantise to 256 colours first (PNG only), dropping alpha
+        """
+        if format not in ("png", "webp"):
+            raise ValueError(f"Unknown image format {format!r}, expected 'png' or 'webp'")
+
+        self.format = format
+        self.level = level
+        self.palette = palette
+
+    @property
+    def filename(self) -> str:
+        return f"out.{self.format}"
+
+    def encode(self, image: Image.Image, keep: Iterable[Tuple[int, int, int]] = ()) -> bytes:
+        """
+        image   | image to encode
+        keep    | colours that must come out exactly when quantising, e.g. a graph's legend. Up to 255
+        """
+        with BytesIO() as bin:
+            if self.format == "webp":
+                # Method 0 is the fastest lossless effort, and still beats PNG on size for renders with photos in them
+                image.save(bin, "webp", lossless=True, method=0)
+            elif self.palette:
+                image = quantize(image.convert("RGB"), list(dict.fromkeys(keep))[:255])
+                image.save(bin, "png", compress_level=self.level)
+            else:
+                # Run length matching suits the big flat areas of the templates and is cheaper than the default
+                # strategy; it only loses to the default on palette images
+                image.save(bin, "png", compress_level=self.level, compress_type=zlib.Z_RLE)
+            return bin.getvalue()
+
+
+def quantize(image: Image.Image, keep: List[Tuple[int, int, int]]) -> Image.Image:
+    """
+    Reduces an RGB image to a 256 colour palette with the fast octree quantiser, keeping the colours in `keep` exact
+    """
+    # Fast octree is the only quantiser cheap enough to win back its own cost
+    if not keep:
+        return image.quantize(256, method=Image.Quantize.FASTOCTREE)
+
+    # Quantise a row of the kept colours along with the image, to find out which palette entry each one ends up as
+    width, height = image.size
+    canvas = Image.new("RGB", (max(width, len(keep)), height + 1))
+    canvas.paste(image)
+    row = Image.new("RGB", (len(keep), 1))
+    row.putdata(keep)
+    canvas.paste(row, (0, height))
+
+    quantized = canvas.quantize(256, method=Image.Quantize.FASTOCTREE)
+    entries = [quantized.getpixel((x, height)) for x in range(len(keep))]
+    if len(set(entries)) < len(keep):
+        # Two kept colours are close enough to share an entry
+        return reserved(image, keep)
+
+    # An entry is the average of every colour that fell into it, so it's only close to the kept colour. Every pixel
+    # of a colour maps to the same entry, so setting the entry to the kept colour makes all of them exact
+    palette = quantized.getpalette()
+    for entry, colour in zip(entries, keep):
+        palette[entry * 3 : entry * 3 + 3] = colour
+    quantized.putpalette(palette)
+    return quantized.crop((0, 0, width, height))
+
+
+def reserved(image: Image.Image, keep: List[Tuple[int, int, int]]) -> Image.Image:
+    """
+    Slower fallback for `quantize`: gives each kept colour a palette entry of its own after the octree's, and moves
+    their pixels to it
+    """
+    quantized = image.quantize(256 - len(keep), method=Image.Quantize.FASTOCTREE)
+    palette = quantized.getpalette()[: 3 * (256 - len(keep))]
+    first = len(palette) // 3
+
+    # Kept colours' entries, indexed by 0xRRGGBB. 0 is never one, so it means the colour isn't kept
+    lookup = np.zeros(1 << 24, np.uint16)
+    for i, (r, g, b) in enumerate(keep):
+        lookup[r << 16 | g << 8 | b] = first + i
+
+    pixels = np.asarray(image, dtype=np.uint32)
+    found = lookup[pixels[..., 0] << 16 | pixels[..., 1] << 8 | pixels[..., 2]]
+    indices = np.array(quantized)
+    np.copyto(indices, found, where=found > 0, casting="unsafe")
+
+    remapped = Image.fromarray(indices, "P")
+    remapped.putpalette(palette + [level for colour in keep for level in colour])
+    return remapped
+
+
+# Activity graphs, both saved as yesterday's graph and uploaded by `$graph`
+GRAPH = Profile("png", palette=GRAPH_PALETTE)
+# `$specs` replies
+SPECS = Profile(SPECS_FORMAT)
@@ -0,0 +1,13 @@
+import os
+from typing import Union
+
+
+def atomic_write(path: str, data: Union[bytes, str]) -> None:
+    """
+    Replaces the file at `path` with `data`. Blocking
+
+    Written to a temporary file and renamed, so a crash or a concurrent reader never sees half a file
+    """
+    with open(f"{path}.tmp", "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+    os.replace(f"{path}.tmp", path)
@@ -1,17 +1,278 @@
+import os
+import re
+import time
+import json
 import asyncio
+import hashlib
+import threading
+import logging
 import aiohttp
-from typing import List, Tuple
+from pathlib import Path
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+from .lru import LRU
+from .files import atomic_write
+from .metrics import REGISTRY
+
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_DIR = f"{Path(__file__).resolve().parents[3]}/data/cache"
+# How long a response is trusted without revalidating, unless the server says otherwise
+DEFAULT_MAX_AGE = 60 * 60
+# Upper bound on the size of the on-disk tier
+MAX_DISK_BYTES = int(os.getenv("REMOTE_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+# Connection pool limits, overall and per host (almost everything comes from cdn.discordapp.com)
+POOL_LIMIT = 100
+POOL_LIMIT_PER_HOST = 16
+TIMEOUT = aiohttp.ClientTimeout(total=15, connect=5, sock_read=10)
+
+FETCH_SECONDS = REGISTRY.histogram(
+    "redqct_fetch_seconds",
+    "Time taken to get a remote image, by whether it was cached, revalidated, downloaded, stale or failed",
+    ("result",),
+)
+
+
+class Entry:
+    """
+    A cached response body along with what's needed to revalidate it
+    """
+
+    __slots__ = ("body", "etag", "last_modified", "expires")
+
+    def __init__(
+        self, body: bytes, etag: Optional[str], last_modified: Optional[str], expires: float
+    ) -> None:
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    def fresh(self) -> bool:
+        return time.time() < self.expires
+
+    def validators(self) -> Dict[str, str]:
+        """
+        Conditional request headers that let the server answer 304 if the body hasn't changed
+        """
+        headers: Dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def expiry(headers) -> float:
+    """
+    Works out when a response stops being fresh from its Cache-Control header
+    """
+    cache_control = headers.get("Cache-Control", "")
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return time.time()
+    if match := re.search(r"max-age=(\d+)", cache_control):
+        return time.time() + int(match.group(1))
+    return time.time() + DEFAULT_MAX_AGE
+
+
+class RemoteCache_:
+    """
+    Two tier cache of remote files keyed by URL: an LRU in memory in front of a size bounded directory under `data/`
+    """
+
+    __slots__ = ("memory", "directory", "max_bytes", "disk_bytes", "lock")
+
+    def __init__(self, directory: str, max_bytes: int, max_entries: int = 256) -> None:
+        self.memory: LRU[str, Entry] = LRU(maxsize=max_entries)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Worked out on the first write to disk
+        self.disk_bytes: Optional[int] = None
+        # Held while writing to or evicting from disk, since puts run on several threads at once
+        self.lock = threading.Lock()
+
+    def path(self, url: str) -> str:
+        return f"{self.directory}/{hashlib.sha256(url.encode()).hexdigest()[:32]}"
+
+    def get(self, url: str) -> Optional[Entry]:
+        """
+        Looks `url` up in memory, then on disk. Blocking
+        """
+        if entry := self.memory.get(url):
+            return entry
+
+        path = self.path(url)
+        try:
+            with open(f"{path}.json", "r") as f:
+                meta = json.load(f)
+            with open(path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+
+        # Mark it as recently used for disk eviction
+        os.utime(path)
+        entry = Entry(body, meta["etag"], meta["last_modified"], meta["expires"])
+        self.memory.put(url, entry)
+        return entry
+
+    def put(self, url: str, entry: Entry) -> None:
+        """
+        Stores `entry` in memory and on disk. Blocking
+        """
+        self.memory.put(url, entry)
+
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if self.disk_bytes is None:
+                self.disk_bytes = self.usage()
+
+            path = self.path(url)
+            previous = os.path.getsize(path) if os.path.isfile(path) else 0
+
+            atomic_write(path, entry.body)
+            self.refresh(url, entry)
+
+            self.disk_bytes += len(entry.body) - previous
+            if self.disk_bytes > self.max_bytes:
+                self.evict()
+
+    def refresh(self, url: str, entry: Entry) -> None:
+        """
+        Saves new validators and freshness for an entry whose body hasn't changed. Blocking
+        """
+        atomic_write(
+            f"{self.path(url)}.json",
+            json.dumps({"etag": entry.etag, "last_modified": entry.last_modified, "expires": entry.expires}),
+        )
+
+    def usage(self) -> int:
+        # Bodies are the only files without an extension
+        names = [name for name in os.listdir(self.directory) if "." not in name]
+        return sum(os.path.getsize(f"{self.directory}/{name}") for name in names)
+
+    def evict(self) -> None:
+        """
+        Deletes the least recently used files until the disk tier is back under 90% of its limit. Called with
+        `self.lock` held
+        """
+        bodies = [f"{self.directory}/{name}" for name in os.listdir(self.directory) if "." not in name]
+        bodies.sort(key=os.path.getmtime)
+        self.disk_bytes = sum(os.path.getsize(body) for body in bodies)
+
+        for body in bodies:
+            if self.disk_bytes <= self.max_bytes * 0.9:
+                break
+            self.disk_bytes -= os.path.getsize(body)
+            os.remove(body)
+            if os.path.isfile(meta := f"{body}.json"):
+                os.remove(meta)
+
+
+RemoteCache = RemoteCache_(CACHE_DIR, MAX_DISK_BYTES)
 
 
 async def fetch_bytes(session: aiohttp.ClientSession, url: str, id: str) -> Tuple[bytes, str]:
-    async with session.get(url) as response:
-        # Debug
-        print(response.status, response.content_type)
+    start = time.perf_counter()
+    entry = await asyncio.to_thread(RemoteCache.get, url)
+
+    if entry and entry.fresh():
+        # Served without touching the network
+        FETCH_SECONDS.observe(time.perf_counter() - start, "cached")
+        return (entry.body, id)
+
+    async with session.get(url, headers=entry and entry.validators() or {}) as response:
+        logger.debug("%s %s from %s", response.status, response.content_type, url)
+
+        if response.status == 304 and entry:
+            # Unchanged since it was cached; just extend its freshness
+            entry.expires = expiry(response.headers)
+            await asyncio.to_thread(RemoteCache.refresh, url, entry)
+            FETCH_SECONDS.observe(time.perf_counter() - start, "revalidated")
+            return (entry.body, id)
+
+        if entry and (response.status >= 500 or response.status == 429):
+            # The CDN is struggling or rate limiting us; an out of date image beats an error page
+            FETCH_SECONDS.observe(time.perf_counter() - start, "stale")
+            return (entry.body, id)
+
         bytes = await response.read()
+
+        if response.status == 200:
+            entry = Entry(
+                bytes,
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+                expiry(response.headers),
+            )
+            await asyncio.to_thread(RemoteCache.put, url, entry)
+
+        FETCH_SECONDS.observe(
+            time.perf_counter() - start, response.status == 200 and "downloaded" or "failed"
+        )
         return (bytes, id)
 
 
+class Session_:
+    """
+    Holds the process wide aiohttp session, so connections (and their TLS handshakes) are kept alive between renders
+    """
+
+    __slots__ = ("session", "inflight")
+
+    def __init__(self) -> None:
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Fetches that are currently running, keyed by URL, so concurrent renders share one download
+        self.inflight: Dict[str, asyncio.Task[Tuple[bytes, str]]] = {}
+
+    def get(self) -> aiohttp.ClientSession:
+        """
+        Returns the shared session, opening it if needed. Must be called from the event loop
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=POOL_LIMIT,
+                limit_per_host=POOL_LIMIT_PER_HOST,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=TIMEOUT)
+        return self.session
+
+    async def close(self) -> None:
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def fetch(self, url: str) -> bytes:
+        """
+        Fetches `url`, joining a fetch of the same URL if one is already running
+        """
+        if (task := self.inflight.get(url)) is None:
+            # The download runs in its own task, so one caller being cancelled (e.g. a command timing out) doesn't
+            # cancel it for everyone else waiting on the same URL
+            task = asyncio.ensure_future(fetch_bytes(self.get(), url, url))
+            self.inflight[url] = task
+            task.add_done_callback(partial(self.done, url))
+
+        body, _ = await asyncio.shield(task)
+        return body
+
+    def done(self, url: str, task: "asyncio.Task[Tuple[bytes, str]]") -> None:
+        if self.inflight.get(url) is task:
+            del self.inflight[url]
+
+        if not task.cancelled():
+            # Mark any exception as retrieved in case every caller was cancelled before it finished
+            task.exception()
+
+
+Session = Session_()
+
+
 async def fetch_all(pairs: List[Tuple[str, str]]) -> List[Tuple[bytes, str]]:
-    async with aiohttp.ClientSession() as session:
-        results = await asyncio.gather(*[fetch_bytes(session, *pair) for pair in pairs])
-        return results
+    results = await asyncio.gather(*[Session.fetch(url) for url, _ in pairs])
+    return [(body, id) for body, (_, id) in zip(results, pairs)]
@@ -1,23 +1,49 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from PIL import Image, ImageFont, ImageDraw
 from datetime import datetime
-from typing import Tuple, List, Optional, Dict
+from typing import Tuple, List, Optional, Dict, Iterable, NamedTuple
+from itertools import groupby, accumulate
+from bisect import bisect_right
+from functools import lru_cache
 from io import BytesIO
+import hashlib
 from fontTools.ttLib import TTFont
+import numpy as np
 
 from discord import Status, Colour
 
 from . import MemberAttrs
 from .http import fetch_all
+from .lru import LRU
+from .metrics import REGISTRY
+from .encode import SPECS
 
 
 ROOT_DIR = Path(__file__).resolve().parents[3]
+# Number of processes `$specs` images are rendered in. 0 renders in a thread of the bot's own process instead
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+
+
+def composited(path: str) -> Image.Image:
+    """
+    Opens a template image as RGBA, alpha composed onto nothing
+
+    Alpha composing the background with nothing allows support of alpha values when calling Image.paste
+    """
+    template = Image.open(path).convert("RGBA")
+    return Image.alpha_composite(Image.new("RGBA", template.size), template)
 
 
 class Cache_:
     __slots__ = (
         "member_template_v2",
         "banner_template_v2",
+        "banner_mask_v2",
         "custom_activity_template_v2",
         "dummy_activity_template_v2",
         "activity_template_v2",
@@ -47,26 +73,32 @@ class Cache_:
         "noto_25",
         "noto_30",
         "unisans",
+        "unisans_glyphs",
     )
 
     def __init__(self) -> None:
         # fmt: off
-        self.member_template_v2 = Image.open(f"{ROOT_DIR}/assets/v2/redqct-member-1300x265.png")
-        self.banner_template_v2 = Image.open(f"{ROOT_DIR}/assets/v2/redqct-banner-1300x184.png")
-        self.custom_activity_template_v2 = Image.open(f"{ROOT_DIR}/assets/v2/redqct-customstatus-1300x100.png")
-        self.dummy_activity_template_v2 = Image.open(f"{ROOT_DIR}/assets/v2/redqct-dummy-1300x335.png")
-        self.activity_template_v2 = Image.open(f"{ROOT_DIR}/assets/v2/redqct-activity-1300x335.png")
+        # Templates are stored ready to be copied, so a render never has to convert or composite them
+        self.member_template_v2 = composited(f"{ROOT_DIR}/assets/v2/redqct-member-1300x265.png")
+        self.banner_template_v2 = composited(f"{ROOT_DIR}/assets/v2/redqct-banner-1300x184.png")
+        self.custom_activity_template_v2 = composited(f"{ROOT_DIR}/assets/v2/redqct-customstatus-1300x100.png")
+        self.dummy_activity_template_v2 = composited(f"{ROOT_DIR}/assets/v2/redqct-dummy-1300x335.png")
+        self.activity_template_v2 = composited(f"{ROOT_DIR}/assets/v2/redqct-activity-1300x335.png")
 
         # self.member_template = Image.open(f"{ROOT_DIR}/assets/redqct-empty-template-member-1100x600.png")
         # self.banner_template = Image.open(f"{ROOT_DIR}/assets/redqct-empty-template-banner-1100x150.png")
         # self.custom_activity_template = Image.open(f"{ROOT_DIR}/assets/redqct-empty-template-custom-status-1100x100.png")
         # self.dummy_activity_template = Image.open(f"{ROOT_DIR}/assets/redqct-empty-template-dummy-1100x335.png")
         # self.activity_template = Image.open(f"{ROOT_DIR}/assets/redqct-empty-template-activity-1100x335.png")
-        self.graph_template = Image.open(f"{ROOT_DIR}/assets/redqct-graph-empty-template-1920x1080.png")
+        self.graph_template = composited(f"{ROOT_DIR}/assets/redqct-graph-empty-template-1920x1080.png")
         # fmt: on
-        self.pfp_mask = Image.open(f"{ROOT_DIR}/assets/mask_pfp.png")
-        self.activity_mask = Image.open(f"{ROOT_DIR}/assets/mask_activity.png")
-        self.status_mask = Image.open(f"{ROOT_DIR}/assets/mask_status_60.png")
+        # Opaque wherever the banner template isn't fully transparent, i.e. everywhere an accent colour is painted
+        banner_pixels = np.array(self.banner_template_v2)
+        self.banner_mask_v2 = Image.fromarray(banner_pixels.any(axis=2).astype(np.uint8) * 255, "L")
+        # Masks are converted to grayscale up front for better accuracy
+        self.pfp_mask = Image.open(f"{ROOT_DIR}/assets/mask_pfp.png").convert("L")
+        self.activity_mask = Image.open(f"{ROOT_DIR}/assets/mask_activity.png").convert("L")
+        self.status_mask = Image.open(f"{ROOT_DIR}/assets/mask_status_60.png").convert("L")
         self.status_underlay = Image.open(f"{ROOT_DIR}/assets/status_underlay_69.png")
 
         self.light_online = Image.open(f"{ROOT_DIR}/assets/status_online.png").resize((48, 47))
@@ -87,10 +119,28 @@ class Cache_:
         self.noto_30 = ImageFont.truetype(f"{ROOT_DIR}/fonts/NotoSansMonoCJK-VF.ttf", 30)
 
         self.unisans = TTFont(f"{ROOT_DIR}/fonts/Uni Sans.ttf")
+        # Every codepoint Uni Sans has a glyph for, so checking support is a single set lookup
+        self.unisans_glyphs = frozenset(
+            codepoint for table in self.unisans["cmap"].tables for codepoint in table.cmap  # type: ignore
+        )
 
 
 Cache = Cache_()
 
+# Rendered widths of runs of text, keyed by (font, run)
+TEXT_WIDTHS: LRU[Tuple[ImageFont.FreeTypeFont, str], int] = LRU(maxsize=4096)
+# Banner templates painted in members' accent colours, keyed by (r, g, b)
+BANNERS: LRU[Tuple[int, int, int], Image.Image] = LRU(maxsize=64)
+# Decoded remote images already cropped by a mask, keyed by (digest of the image's bytes, mask name)
+CROPPED: LRU[Tuple[bytes, str], Image.Image] = LRU(maxsize=128)
+
+RENDER_SECONDS = REGISTRY.histogram(
+    "redqct_render_seconds", "Time taken to render a $specs image, including queueing"
+)
+RENDER_STAGE_SECONDS = REGISTRY.histogram(
+    "redqct_render_stage_seconds", "Time taken by each stage of rendering a $specs image", ("stage",)
+)
+
 
 class Template:
     """
@@ -98,8 +148,8 @@ class Template:
     """
 
     def __init__(self, template: Image.Image) -> None:
-        # Alpha composing the background with nothing allows support of alpha values when calling Image.paste
-        self._background = Image.alpha_composite(Image.new("RGBA", template.size), template.convert("RGBA"))
+        # Templates in `Cache` are already composited (see `composited`), so a copy is all that's needed
+        self._background = template.copy()
 
     def draw(self, image: Image.Image, coords: Tuple[int, int]) -> None:
         self._background.paste(image, coords, image)
@@ -143,20 +193,68 @@ def masked(img: Image.Image, mask: Image.Image) -> Image.Image:
     """
 
     img = img.resize(mask.size)
-    # Convert the mask to grayscale for better accuracy
-    mask = mask.convert("L")
+    # Convert the mask to grayscale for better accuracy. The masks in `Cache` already are
+    if mask.mode != "L":
+        mask = mask.convert("L")
     assert img.size == mask.size
-    return Image.composite(img, Image.new("RGBA", mask.size), mask).convert("RGBA")
+    return Image.composite(img, transparent(mask.size), mask).convert("RGBA")
 
 
-def contains_glyph(font: TTFont, char: str) -> bool:
+def cropped(raw: bytes, mask: str) -> Image.Image:
     """
-    Checks if `font` contains (i.e. supports) a singular charcter `char`
+    Decodes a remote image and crops it with one of the masks in `Cache`, reusing the result for identical images
+
+    raw     | encoded image, as fetched
+    mask    | name of the mask's attribute in `Cache`, e.g. "pfp_mask"
     """
-    for table in font["cmap"].tables:  # type: ignore
-        if ord(char) in table.cmap.keys():
-            return True
-    return False
+    key = (hashlib.blake2b(raw, digest_size=16).digest(), mask)
+
+    if (img := CROPPED.get(key)) is None:
+        img = masked(Image.open(BytesIO(raw)), getattr(Cache, mask))
+        CROPPED.put(key, img)
+
+    return img
+
+
+@lru_cache(maxsize=8)
+def transparent(size: Tuple[int, int]) -> Image.Image:
+    """
+    Returns a fully transparent image of a given size. Shared, so it must not be mutated
+    """
+    return Image.new("RGBA", size)
+
+
+def contains_glyph(char: str) -> bool:
+    """
+    Checks if Uni Sans contains (i.e. supports) a singular charcter `char`
+    """
+    return ord(char) in Cache.unisans_glyphs
+
+
+@lru_cache(maxsize=1024)
+def coverage(line: str) -> Tuple[Tuple[str, bool], ...]:
+    """
+    Splits a line of text into runs of consecutive characters that share a font
+
+    Returns (run, supported) pairs, where `supported` is whether Uni Sans can render the run
+    """
+    glyphs = Cache.unisans_glyphs
+    return tuple(
+        ("".join(run), supported) for supported, run in groupby(line, key=lambda c: ord(c) in glyphs)
+    )
+
+
+def text_width(run: str, font: ImageFont.FreeTypeFont) -> int:
+    """
+    Returns the width in pixels of a run of text rendered in a single font, including kerning
+    """
+    key = (font, run)
+
+    if (width := TEXT_WIDTHS.get(key)) is None:
+        width = round(font.getlength(run))
+        TEXT_WIDTHS.put(key, width)
+
+    return width
 
 
 def draw_text(
@@ -178,26 +276,33 @@ def draw_text(
 
     Returns the total width of the rendered text
     """
-    can_unisans: List[bool] = [contains_glyph(Cache.unisans, char) for char in line]
     x, y = start
     net_offset: int = 0
 
-    for i, char in enumerate(line):
-        # If the character is supported by Unisans, use the wanted font. Else, use Noto
-        font = [fallback, wanted_font][can_unisans[i]]
-        # Render the individual character. If the font is a fallback Noto font, translate the y value up 4px for alignment
+    for run, supported in coverage(line):
+        # If the run is supported by Unisans, use the wanted font. Else, use Noto
+        font = [fallback, wanted_font][supported]
+        # Render the whole run at once. If the font is a fallback Noto font, translate the y value up 4px for alignment
         interface.text(
             (x + net_offset, font == fallback and y - 4 or y),
-            char,
+            run,
             fill=colour,
             font=font,
         )
-        # Calculate the width of the character, add to offset
-        net_offset += interface.textsize(char, font=font)[0]
+        # Calculate the width of the run, add to offset
+        net_offset += text_width(run, font)
 
     return net_offset
 
 
+def measure_text(line: str, wanted_font: ImageFont.FreeTypeFont, fallback: ImageFont.FreeTypeFont) -> int:
+    """
+    Returns the width `draw_text` would render a line of text at, without rendering it
+    """
+    return sum(text_width(run, [fallback, wanted_font][supported]) for run, supported in coverage(line))
+
+
+@lru_cache(maxsize=1024)
 def truncate(
     text: str,
     max_width: int,
@@ -205,34 +310,43 @@ def truncate(
     fallback: ImageFont.FreeTypeFont,
 ) -> str:
     """
-    Cuts down a long string of text to a particular width
+    Cuts down a long string of text to a particular width, ending it with an ellipsis if anything was cut
 
     text        | string of characters to be truncated
     max_width   | desired maximum width of the text in pixels
     wanted_font | desired font for each character to be rendered in
     fallback    | preferably a type of "Noto" font to use if Uni Sans doesn't work
     """
-    dummy = Image.new("RGBA", (0, 0))
-    dummy_interface = ImageDraw.Draw(dummy)
-    cut = False
+    if measure_text(text, wanted_font, fallback) <= max_width:
+        return text
+
+    # Cumulative advances of every prefix of the text, measured a character at a time
+    fonts = [[fallback, wanted_font][supported] for run, supported in coverage(text) for _ in run]
+    prefixes = [0, *accumulate(text_width(char, font) for char, font in zip(text, fonts))]
+    budget = max_width - measure_text("…", wanted_font, fallback)
+
+    # The longest prefix that should fit alongside the ellipsis
+    keep = max(bisect_right(prefixes, budget) - 1, 0)
 
-    while 1:
-        # Cuts down the text until its max_width in width or less
-        # TODO: Make this more efficient and smart by cutting down more or less characters at a time
-        width = draw_text(dummy_interface, text, (255, 255, 255), (0, 0), wanted_font, fallback)
+    # Kerning makes whole runs slightly narrower than the sum of their characters, so correct the estimate
+    while keep > 0 and measure_text(text[:keep] + "…", wanted_font, fallback) > max_width:
+        keep -= 1
+    while keep + 1 < len(text) and measure_text(text[: keep + 1] + "…", wanted_font, fallback) <= max_width:
+        keep += 1
 
-        if width > max_width and not cut:
-            # Replace the last character with a Unicode ellipses. This can only be done once.
-            text = text[:-1] + "…"
-            cut = True
-            continue
-        elif width > max_width and cut:
-            # Remove letters before the ellipses
-            text = text[:-2] + text[-1]
-        elif width <= max_width:
-            break
+    return text[:keep] + "…"
+
+
+def tinted_banner(colour: Tuple[int, int, int]) -> Image.Image:
+    """
+    Returns the banner template with every non transparent pixel painted in a solid colour
+    """
+    if (banner := BANNERS.get(colour)) is None:
+        banner = Image.new("RGBA", Cache.banner_mask_v2.size)
+        banner.paste((*colour, 255), mask=Cache.banner_mask_v2)
+        BANNERS.put(colour, banner)
 
-    return text
+    return banner
 
 
 def generate_member(
@@ -245,20 +359,14 @@ def generate_member(
 ) -> Image.Image:
     """
     Generates the member piece of the overall image using a template
+
+    avatar  | the member's avatar, already cropped with `Cache.pfp_mask` (see `cropped`)
     """
     template = MemberTemplate()
     if banner_colour:
-        rgb_banner_template = Cache.banner_template_v2.convert("RGBA")
-        for y in range(rgb_banner_template.height):
-            for x in range(rgb_banner_template.width):
-                if rgb_banner_template.getpixel((x, y)) != (0, 0, 0, 0):
-                    rgb_banner_template.putpixel(
-                        (x, y), (banner_colour.r, banner_colour.g, banner_colour.b, 255)
-                    )
-        template.draw(rgb_banner_template, (0, 0))
+        template.draw(tinted_banner(banner_colour.to_rgb()), (0, 0))
     # Render avatar and light
-    cropped_pfp = masked(avatar, Cache.pfp_mask)
-    template.draw(cropped_pfp, (30, 50))
+    template.draw(avatar, (30, 50))
     template.draw(Cache.status_underlay, (164, 184))
 
     match status:
@@ -344,6 +452,9 @@ def generate_activity(
     """
     Generates an activity piece of the overall image using a template
 
+    image_large | already cropped with `Cache.activity_mask` (see `cropped`)
+    image_small | already cropped with `Cache.status_mask` (see `cropped`)
+
     kwargs:
     `dummy`: bool   | When set to `True`, returns an empty activity piece
     """
@@ -362,13 +473,11 @@ def generate_activity(
         template = ActivityTemplate(dummy=True)
     else:
         template = ActivityTemplate(dummy=False)
-        cropped_image = masked(image_large, Cache.activity_mask)
-        template.draw(cropped_image, (48, 91))
+        template.draw(image_large, (48, 91))
 
     if image_small:
-        cropped_image_small = masked(image_small, Cache.status_mask)
         template.draw(Cache.status_underlay, (177, 215))
-        template.draw(cropped_image_small, (177 + 4, 215 + 4))
+        template.draw(image_small, (177 + 4, 215 + 4))
 
     edit = template.to_editable()
 
@@ -418,9 +527,148 @@ def stitch(pieces: List[Image.Image]) -> Image.Image:
     return background
 
 
-async def generate_img(attrs: MemberAttrs) -> Image.Image:
+class ActivitySpec(NamedTuple):
+    """
+    Everything needed to render an activity piece, in a form that can be sent to a render worker
+    """
+
+    type: str
+    image_large: Optional[bytes]
+    image_small: Optional[bytes]
+    lines: Tuple[str, str, str, str]
+
+
+class SpecsSpec(NamedTuple):
+    """
+    Everything needed to render a `$specs` image, in a form that can be sent to a render worker
+    """
+
+    name: str
+    tag: str
+    nick: Optional[str]
+    status: str
+    avatar: bytes
+    banner_colour: Optional[Tuple[int, int, int]]
+    custom_activity: Optional[str]
+    activities: List[ActivitySpec]
+
+
+def render_specs(spec: SpecsSpec) -> Tuple[bytes, List[Tuple[str, float]]]:
     """
-    Generates an image and returns it, based off a MemberAttrs instance
+    Renders a `$specs` image, returning it encoded with the `SPECS` profile. Blocking, so it is run by `Renderer`
+
+    Also returns how long each stage took, since workers can't record metrics in the bot's process themselves
+    """
+    stages: List[Tuple[str, float]] = []
+    clock = time.perf_counter()
+
+    def lap(stage: str) -> None:
+        nonlocal clock
+        now = time.perf_counter()
+        stages.append((stage, now - clock))
+        clock = now
+
+    avatar = cropped(spec.avatar, "pfp_mask")
+    images = [
+        (
+            activity.image_large and cropped(activity.image_large, "activity_mask") or None,
+            activity.image_small and cropped(activity.image_small, "status_mask") or None,
+        )
+        for activity in spec.activities
+    ]
+    lap("decode")
+
+    member_piece = generate_member(
+        spec.name,
+        spec.tag,
+        spec.nick,
+        Status(spec.status),
+        avatar,
+        spec.banner_colour and Colour.from_rgb(*spec.banner_colour) or None,
+    )
+    lap("member")
+
+    activity_pieces = [
+        generate_activity(image_large, image_small, activity.type, *activity.lines)
+        for activity, (image_large, image_small) in zip(spec.activities, images)
+    ]
+
+    # Create a dummy piece if no activity pieces were generated
+    if len(activity_pieces) == 0:
+        activity_pieces.append(generate_activity(None, None, "", "", "", "", "", dummy=True))
+    lap("activities")
+
+    custom_pieces = spec.custom_activity is not None and [generate_custom_status(spec.custom_activity)] or []
+    lap("custom_status")
+
+    img = stitch(
+        [member_piece, *custom_pieces, *activity_pieces, Image.new("RGBA", (1300, 10), (41, 43, 47))]
+    )
+    lap("stitch")
+
+    encoded = SPECS.encode(img)
+    lap("encode")
+
+    return (encoded, stages)
+
+
+def warm_up() -> None:
+    """
+    Runs once in every render worker, so fonts and templates are loaded before the first real render
+    """
+    generate_activity(None, None, "", "", "", "", "", dummy=True)
+    measure_text("Warm up 日本", Cache.bold_30, Cache.noto_30)
+
+
+class Renderer_:
+    """
+    Runs `render_specs` off the event loop, in a pool of worker processes each holding their own `Cache`
+
+    With 0 workers, renders happen on a thread in this process instead
+    """
+
+    __slots__ = ("workers", "executor")
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        # Started on first use, so importing this module doesn't spawn processes
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    async def render(self, spec: SpecsSpec) -> bytes:
+        with RENDER_SECONDS.time():
+            encoded, stages = await self.run(spec)
+
+        for stage, duration in stages:
+            RENDER_STAGE_SECONDS.observe(duration, stage)
+
+        return encoded
+
+    async def run(self, spec: SpecsSpec) -> Tuple[bytes, List[Tuple[str, float]]]:
+        if self.workers == 0:
+            return await asyncio.to_thread(render_specs, spec)
+
+        if self.executor is None:
+            # Spawned rather than forked, since the bot's threads and event loop don't survive a fork
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_up,
+            )
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, render_specs, spec)
+
+    def shutdown(self) -> None:
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+Renderer = Renderer_(RENDER_WORKERS)
+
+
+async def generate_img(attrs: MemberAttrs) -> bytes:
+    """
+    Generates an image based off a MemberAttrs instance, returning it encoded with the `SPECS` profile
     """
     urls: List[Tuple[str, str]] = [(attrs.avatar, "avatar")]
 
@@ -449,9 +697,8 @@ async def generate_img(attrs: MemberAttrs) -> Image.Image:
 
     # Goes through all the results and finds the avatar image by locating its corresponding identifier "avatar"
     avatar_bytes = [result[0] for result in results if result[1] == "avatar"][0]
-    avatar_png = Image.open(BytesIO(avatar_bytes))
 
-    image_groups: List[List[Optional[Image.Image]]] = [[None, None] for _ in range(len(attrs.activities))]
+    image_groups: List[List[Optional[bytes]]] = [[None, None] for _ in range(len(attrs.activities))]
 
     # Pairs all the activity images so that this structure is formed:
     # [(large0, small0), (large1, small1), (large2, small2), ... (largen, smalln)]
@@ -461,43 +708,30 @@ async def generate_img(attrs: MemberAttrs) -> Image.Image:
         img_type = img_id[:-1]
 
         if img_type == "image_large":
-            image_groups[int(idx)][0] = Image.open(BytesIO(result[0]))
+            image_groups[int(idx)][0] = result[0]
         elif img_type == "image_small":
-            image_groups[int(idx)][1] = Image.open(BytesIO(result[0]))
-
-    member_piece = generate_member(
-        attrs.name, attrs.tag, attrs.nick, attrs.status, avatar_png, attrs.banner_colour
+            image_groups[int(idx)][1] = result[0]
+
+    spec = SpecsSpec(
+        name=attrs.name,
+        tag=attrs.tag,
+        nick=attrs.nick,
+        status=attrs.status.value,
+        avatar=avatar_bytes,
+        banner_colour=attrs.banner_colour and attrs.banner_colour.to_rgb() or None,
+        custom_activity=attrs.customActivity,
+        activities=[
+            ActivitySpec(
+                type=activity.type,
+                image_large=image_groups[idx][0],
+                image_small=image_groups[idx][1],
+                lines=(activity.line1, activity.line2, activity.line3, activity.line4),
+            )
+            for idx, activity in enumerate(attrs.activities)
+        ],
     )
 
-    activity_pieces = [
-        generate_activity(
-            image_groups[idx][0],
-            image_groups[idx][1],
-            activity.type,
-            activity.line1,
-            activity.line2,
-            activity.line3,
-            activity.line4,
-        )
-        for idx, activity in enumerate(attrs.activities)
-    ]
-
-    # Create a dummy piece if no activity pieces were generated
-    if len(activity_pieces) == 0:
-        activity_pieces.append(generate_activity(None, None, "", "", "", "", "", dummy=True))
-
-    return (
-        attrs.customActivity is not None
-        and stitch(
-            [
-                member_piece,
-                generate_custom_status(attrs.customActivity),
-                *activity_pieces,
-                Image.new("RGBA", (1300, 10), (41, 43, 47)),
-            ]
-        )
-        or stitch([member_piece, *activity_pieces, Image.new("RGBA", (1300, 10), (41, 43, 47))])
-    )
+    return await Renderer.render(spec)
 
 
 def generate_empty_graph(name: str, tag: str, date: datetime, h_off: int, m_off: int) -> Image.Image:
@@ -598,25 +832,8 @@ def draw_legend_entry(
     """
     Draws a new legend entry to an existing graph by mutating it
     """
-    dummy = Image.new("RGBA", (0, 0))
-    dummy_interface = ImageDraw.Draw(dummy)
-    cut = False
-
-    while 1:
-        # Cuts down the text until its 335px in width or less
-        # TODO: Make this more efficient and smart by cutting down more or less characters at a time
-        width = draw_text(dummy_interface, text, (255, 255, 255), (0, 0), Cache.bold_30, Cache.noto_30)
-
-        if width > 335 and not cut:
-            # Replace the last character with a Unicode ellipses. This can only be done once.
-            text = text[:-1] + "…"
-            cut = True
-            continue
-        elif width > 335 and cut:
-            # Remove letters before the ellipses
-            text = text[:-2] + text[-1]
-        elif width <= 335:
-            break
+    # Cuts down the text until its 335px in width or less
+    text = truncate(text, 335, Cache.bold_30, Cache.noto_30)
 
     square = Image.new("RGBA", (30, 30), colour)
     graph.paste(square, coords)
@@ -631,30 +848,80 @@ def draw_minute(
     """
     Draws a 1px line representing a minute of activity to an existing graph by mutating it
     """
-    activities.sort()
+    draw_minutes(graph, [(x, activities)], legend)
+
+
+def draw_minutes(
+    graph: Image.Image, columns: Iterable[Tuple[int, List[str]]], legend: Dict[str, Tuple[int, int, int]]
+) -> None:
+    """
+    Draws many minutes of activity to an existing graph at once by mutating it
 
-    n = len(activities)
+    columns | (x, activities) for each 1px line to be drawn
+    """
+    # Columns with the same activities look identical, so each distinct set is only built once
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for x, activities in columns:
+        groups.setdefault(tuple(sorted(activities)), []).append(x)
 
-    part_height = 800 // n
+    if not groups:
+        return
 
-    chunks = []
+    # Only the 800px tall plot area is ever drawn to
+    region = np.array(graph.crop((0, 174, graph.width, 974)))
 
-    # Divide into "equal groups", splitting the remainder if there is one
-    while (s := sum(chunks)) != 800:
-        if s + part_height > 800:
-            remainder = 800 - s
-            for idx, _ in enumerate(chunks):
-                if remainder == 0:
-                    break
-                chunks[idx] += 1
-                remainder -= 1
-        else:
-            chunks.append(part_height)
+    for activities, xs in groups.items():
+        n = len(activities)
+        # Divide into "equal groups", splitting the remainder across the first few
+        part_height, remainder = divmod(800, n)
+        line = np.empty((800, 4), dtype=np.uint8)
+        top = 0
+
+        for i, activity in enumerate(activities):
+            height = part_height + (i < remainder)
+            line[top : top + height] = (*legend[activity], 255)
+            top += height
+
+        region[:, xs] = line[:, np.newaxis]
+
+    graph.paste(Image.fromarray(region, "RGBA"), (0, 174))
+
+
+def legend_coords(entry: int) -> Tuple[int, int]:
+    """
+    Returns the top left corner of the `entry`th (counting from 1) legend entry of a graph
+    """
+    base_x, base_y = 1538, 210
+    dx, dy = 430, 60
+    vertical_pos = entry % 13
+    n_slice = entry // 13
+    return (base_x + dx * n_slice, base_y + dy * (vertical_pos - 1))
+
+
+def generate_graph(
+    name: str,
+    tag: str,
+    date: datetime,
+    h_off: int,
+    m_off: int,
+    legend: Dict[str, Tuple[int, int, int]],
+    minutes: Iterable[Tuple[int, List[str]]],
+) -> Image.Image:
+    """
+    Renders a whole day's graph from scratch
+
+    legend  | activity names mapped to their colour, in the order they were first seen
+    minutes | (minutes since midnight, activity names) for every minute that had activity
+    """
+    graph = generate_empty_graph(name, tag, date, h_off, m_off)
+
+    for entry, (activity_name, colour) in enumerate(legend.items(), start=1):
+        if entry % 13 == 0:
+            # Stitch a new 430x1080 piece to the right of the current image
+            graph = extend_legend(graph)
 
-    line = Image.new("RGBA", (1, 800), (255, 255, 255, 255))
+        draw_legend_entry(graph=graph, colour=colour, text=activity_name, coords=legend_coords(entry))
 
-    for i in range(len(activities)):
-        segment = Image.new("RGBA", (1, chunks[i]), legend[activities[i]])
-        line.paste(segment, (0, sum(chunks[:i])))
+    draw_minutes(graph, ((49 + minute, activities) for minute, activities in minutes), legend)
 
-    graph.paste(line, (x, 174))
+    return graph
@@ -0,0 +1,58 @@
+import threading
+from typing import Callable, Dict, Tuple
+
+
+Legend = Dict[str, Tuple[int, int, int]]
+
+
+class LegendJournal_:
+    """
+    Write-behind buffer for members' legends
+
+    Legend changes are staged in memory as they happen and handed to the storage backend together by `flush`, so a
+    member picking up several new activities in one tick (or many members at once) costs one write per member per
+    flush, not one per entry
+    """
+
+    __slots__ = ("write", "pending", "lock", "flushes", "writes")
+
+    def __init__(self, write: Callable[[Dict[str, Legend]], None]) -> None:
+        """
+        write | blocking function that saves a batch of legends, keyed by member id
+        """
+        self.write = write
+        # Latest staged legend for each member that hasn't been written yet
+        self.pending: Dict[str, Legend] = {}
+        self.lock = threading.Lock()
+
+        self.flushes = 0
+        self.writes = 0
+
+    def stage(self, id: str, legend: Legend) -> None:
+        """
+        Queues `legend` to be written for member `id`, replacing anything already queued for them
+        """
+        with self.lock:
+            # Copied, since the member's legend keeps changing after it's staged
+            self.pending[id] = dict(legend)
+
+    def discard(self, id: str) -> None:
+        """
+        Drops anything queued for member `id`, e.g. when they're being untracked
+        """
+        with self.lock:
+            self.pending.pop(id, None)
+
+    def flush(self) -> int:
+        """
+        Writes out every queued legend in one batch, returning how many there were. Blocking
+        """
+        with self.lock:
+            batch, self.pending = self.pending, {}
+
+        if batch:
+            self.write(batch)
+            self.writes += len(batch)
+
+        self.flushes += 1
+        return len(batch)
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+from .metrics import REGISTRY
+
+
+# Lowest level written out, e.g. DEBUG to see every new legend entry and CDN response
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of DEBUG records kept, so debug logging can be left on in a big guild
+LOG_SAMPLE = float(os.getenv("LOG_SAMPLE", 1.0))
+# Most records written per logger and message per window; the rest are counted and summarised
+LOG_BURST = int(os.getenv("LOG_BURST", 10))
+LOG_WINDOW = float(os.getenv("LOG_WINDOW", 60.0))
+
+FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+DROPPED = REGISTRY.counter(
+    "redqct_log_records_dropped_total", "Log records dropped by sampling or rate limiting", ("reason",)
+)
+
+
+class RateLimit(logging.Filter):
+    """
+    Drops records that repeat too often, and samples DEBUG records
+
+    Records are grouped by logger and message template (before its arguments are filled in), so e.g. every
+    "Couldn't load member %s" counts against the same limit whichever member it was. The first record let through
+    after some were dropped says how many
+    """
+
+    def __init__(
+        self, burst: int = LOG_BURST, window: float = LOG_WINDOW, sample: float = LOG_SAMPLE
+    ) -> None:
+        """
+        burst   | records let through per logger and message per window
+        window  | seconds before the count for a message starts over
+        sample  | fraction of DEBUG records kept
+        """
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.sample = sample
+        # (logger, message) -> (window start, records let through, records dropped)
+        self.windows: Dict[Tuple[str, str], Tuple[float, int, int]] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and self.sample < 1.0 and random.random() >= self.sample:
+            DROPPED.inc("sampled")
+            return False
+
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+
+        with self.lock:
+            start, passed, dropped = self.windows.get(key, (now, 0, 0))
+            if now - start >= self.window:
+                start, passed = now, 0
+
+            if passed >= self.burst:
+                self.windows[key] = (start, passed, dropped + 1)
+                DROPPED.inc("rate_limited")
+                return False
+
+            self.windows[key] = (start, passed + 1, 0)
+
+        if dropped:
+            record.msg = f"{record.msg} ({dropped} more like this were dropped)"
+        return True
+
+
+class Logging_:
+    """
+    Sends every record through a queue to a background thread that writes it out, so logging from the event loop
+    or a tick worker never waits on the console
+    """
+
+    __slots__ = ("listener",)
+
+    def __init__(self) -> None:
+        self.listener: Optional[QueueListener] = None
+
+    def setup(self, level: str = LOG_LEVEL) -> None:
+        """
+        Routes the root logger through the queue. Safe to call more than once
+        """
+        if self.listener:
+            return
+
+        records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(logging.Formatter(FORMAT))
+
+        # Filtered before queueing, so dropped records cost as little as possible
+        handler = QueueHandler(records)
+        handler.addFilter(RateLimit())
+
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel(level)
+
+        self.listener = QueueListener(records, output)
+        self.listener.start()
+        # Write out whatever is still queued on the way out
+        atexit.register(self.shutdown)
+
+    def shutdown(self) -> None:
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+
+
+Logging = Logging_()
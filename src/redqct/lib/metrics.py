@@ -0,0 +1,218 @@
+import time
+import threading
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bounds (in seconds) of the buckets histograms count into, from a cached lookup to a tick near its budget
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def series(name: str, names: Labels, values: Labels, extra: str = "") -> str:
+    """
+    Formats a sample's name and labels, e.g. `redqct_fetch_seconds_bucket{result="cached",le="0.01"}`
+    """
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return pairs and f"{name}{{{','.join(pairs)}}}" or name
+
+
+def number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """
+    A monotonically increasing count, optionally split by labels
+    """
+
+    __slots__ = ("name", "help", "labels", "values", "lock")
+
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[Labels, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            values = list(self.values.items())
+        for labels, value in values:
+            yield f"{series(self.name, self.labels, labels)} {number(value)}"
+
+
+class Timer:
+    """
+    Context manager that observes how long its body took into a histogram
+    """
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: Labels) -> None:
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Histogram:
+    """
+    Counts observations (usually durations in seconds) into fixed buckets, optionally split by labels
+
+    Observing is a bisect and a few additions under a lock, so it's cheap enough for every tick and render
+    """
+
+    __slots__ = ("name", "help", "labels", "buckets", "values", "lock")
+
+    def __init__(
+        self, name: str, help: str, labels: Labels = (), buckets: Tuple[float, ...] = BUCKETS
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # Per label set: a count for each bucket plus +Inf (not cumulative until collected), then sum and count
+        self.values: Dict[Labels, List[float]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self.lock:
+            if (counts := self.values.get(labels)) is None:
+                counts = self.values[labels] = [0.0] * (len(self.buckets) + 3)
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def time(self, *labels: str) -> Timer:
+        return Timer(self, labels)
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            values = [(labels, list(counts)) for labels, counts in self.values.items()]
+
+        for labels, counts in values:
+            cumulative = 0.0
+            for bound, count in zip((*map(number, self.buckets), "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{series(self.name + '_bucket', self.labels, labels, le)} {number(cumulative)}"
+            yield f"{series(self.name + '_sum', self.labels, labels)} {number(counts[-2])}"
+            yield f"{series(self.name + '_count', self.labels, labels)} {number(counts[-1])}"
+
+
+class Callback:
+    """
+    A metric whose value is read from elsewhere when it's collected, e.g. a count an object already keeps
+    """
+
+    __slots__ = ("name", "help", "kind", "labels", "read")
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        read: Callable[[], Union[float, Dict[Labels, float]]],
+        kind: str = "gauge",
+        labels: Labels = (),
+    ) -> None:
+        """
+        read    | returns the value, or a value per label set if `labels` is given
+        kind    | "gauge" or "counter"
+        """
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = labels
+        self.read = read
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        values = self.read()
+        for labels, value in values.items() if isinstance(values, dict) else [((), values)]:
+            yield f"{series(self.name, self.labels, labels)} {number(value)}"
+
+
+Metric = Union[Counter, Histogram, Callback]
+
+
+class Registry_:
+    """
+    Every metric the process exposes on `/metrics`, in the Prometheus text format
+    """
+
+    __slots__ = ("metrics", "lock")
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            # Re-registering replaces the old metric, so modules can be reloaded
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Labels = ()) -> Counter:
+        counter = Counter(name, help, labels)
+        self.register(counter)
+        return counter
+
+    def histogram(
+        self, name: str, help: str, labels: Labels = (), buckets: Tuple[float, ...] = BUCKETS
+    ) -> Histogram:
+        histogram = Histogram(name, help, labels, buckets)
+        self.register(histogram)
+        return histogram
+
+    def callback(
+        self,
+        name: str,
+        help: str,
+        read: Callable[[], Union[float, Dict[Labels, float]]],
+        kind: str = "gauge",
+        labels: Labels = (),
+    ) -> None:
+        self.register(Callback(name, help, read, kind, labels))
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        lines: List[str] = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                # One broken callback shouldn't take the whole endpoint down
+                logger.warning("Couldn't collect %s: %r", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry_()
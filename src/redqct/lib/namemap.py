@@ -0,0 +1,261 @@
+import os
+import mmap
+import json
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .files import atomic_write
+
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+DETECTABLE_PATH = f"{ROOT_DIR}/detectable.json"
+NAMEMAP_PATH = f"{ROOT_DIR}/namemap.json"
+INDEX_PATH = f"{ROOT_DIR}/namemap.idx"
+
+# An index is laid out as:
+# header | n key entries (offset into the key blob, key length, record number), sorted by key | n records | key blob
+# A record is (application id, icon hash as raw bytes, whether there is an icon)
+_HEADER = struct.Struct("<4sII")
+_KEY = struct.Struct("<IHI")
+_RECORD = struct.Struct("<Q16s?")
+_MAGIC = b"RQNM"
+
+# Application id and icon hash, the same as the values NAMEMAP used to hold
+App = Dict[str, Optional[str]]
+# A namemap.json value: an App along with the app's "aliases" and (non launcher) "executables"
+Entry = Dict[str, Any]
+
+
+def normalise(name: str) -> str:
+    """
+    Folds case and whitespace so lookups aren't thrown off by how a game's name was typed
+    """
+    return " ".join(name.casefold().split())
+
+
+def executable_keys(executable: str) -> List[str]:
+    """
+    Returns the keys a detectable executable is indexed under: its file name, with and without the extension
+    """
+    file_name = normalise(executable.replace("\\", "/").rsplit("/", 1)[-1])
+    stem = file_name.rsplit(".", 1)[0]
+    return [file_name, stem] if stem and stem != file_name else [file_name]
+
+
+def looks_executable(name: str) -> bool:
+    """
+    Whether an activity name looks like an executable path or file name rather than a game's title
+    """
+    return name.endswith(".exe") or "/" in name or "\\" in name
+
+
+def iter_array(path: str, chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """
+    Incrementally parses a file holding a JSON array, yielding one element at a time
+
+    Only one chunk and the element currently being parsed are held in memory, never the whole file
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+
+    with open(path, "r", encoding="utf-8") as f:
+        while 1:
+            # Skip the separators between elements
+            buffer = buffer.lstrip(" \t\r\n,")
+
+            if not started and buffer:
+                assert buffer[0] == "[", f"{path} doesn't hold a JSON array"
+                buffer = buffer[1:]
+                started = True
+                continue
+
+            if buffer.startswith("]"):
+                return
+
+            try:
+                element, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # The element runs past the end of the buffer
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+
+            yield element
+            buffer = buffer[end:]
+
+
+def entries_from_detectable(path: str) -> Dict[str, Entry]:
+    """
+    Streams detectable.json into namemap entries, keyed by name
+
+    Among duplicate names the last app wins, but keeps the position of the first
+    """
+    entries: Dict[str, Entry] = {}
+
+    for app in iter_array(path):
+        entries[app["name"]] = {
+            "application_id": app["id"],
+            "icon_hash": app.get("icon") or None,
+            "aliases": app.get("aliases", []),
+            # Launchers are shared by many games, so they say nothing about which one is running
+            "executables": [e["name"] for e in app.get("executables", []) if not e.get("is_launcher")],
+        }
+
+    return entries
+
+
+def build_namemap(source: str, namemap_path: str, index_path: str) -> Tuple[int, int, int]:
+    """
+    Rebuilds namemap.json and its index from detectable.json, only touching what changed since the last build
+
+    Entries that are unchanged keep their place in namemap.json, so a refresh diffs cleanly. If nothing changed
+    at all, neither file is rewritten
+
+    Returns the number of (added, changed, removed) entries
+    """
+    previous: Dict[str, Entry] = {}
+    if os.path.isfile(namemap_path):
+        with open(namemap_path, "r") as f:
+            previous = json.load(f)
+
+    current = entries_from_detectable(source)
+
+    added = [name for name in current if name not in previous]
+    changed = [name for name in current if name in previous and current[name] != previous[name]]
+    removed = [name for name in previous if name not in current]
+
+    if added or changed or removed or not os.path.isfile(index_path):
+        merged = {name: current[name] for name in previous if name in current}
+        merged.update((name, current[name]) for name in added)
+
+        atomic_write(namemap_path, json.dumps(merged, indent=2))
+
+        build_index(merged, index_path)
+
+    return (len(added), len(changed), len(removed))
+
+
+def index_keys(entries: Dict[str, Entry]) -> Dict[str, Tuple[str, Optional[str]]]:
+    """
+    Maps every lookup key to an (application id, icon hash) pair
+
+    Names take priority over aliases, which take priority over executables. Otherwise the first entry to claim a key
+    keeps it
+    """
+    keys: Dict[str, Tuple[str, Optional[str]]] = {}
+    apps = [(name, (entry["application_id"], entry["icon_hash"]), entry) for name, entry in entries.items()]
+
+    for name, app, _ in apps:
+        keys[normalise(name)] = app
+
+    for _, app, entry in apps:
+        for alias in entry.get("aliases", []):
+            keys.setdefault(normalise(alias), app)
+
+    for _, app, entry in apps:
+        for executable in entry.get("executables", []):
+            for key in executable_keys(executable):
+                keys.setdefault(key, app)
+
+    return keys
+
+
+def build_index(entries: Dict[str, Entry], path: str) -> None:
+    """
+    Compiles namemap entries (in the format of namemap.json) into an index file at `path`
+    """
+    keys = index_keys(entries)
+    records: List[Tuple[str, Optional[str]]] = sorted(set(keys.values()), key=lambda r: (r[0], r[1] or ""))
+    record_numbers = {record: i for i, record in enumerate(records)}
+
+    encoded = sorted((key.encode(), record_numbers[record]) for key, record in keys.items())
+    blob = bytearray()
+    table = bytearray()
+
+    for key, record_number in encoded:
+        table += _KEY.pack(len(blob), len(key), record_number)
+        blob += key
+
+    body = bytearray(_HEADER.pack(_MAGIC, len(encoded), len(records)))
+    body += table
+    for application_id, icon_hash in records:
+        body += _RECORD.pack(int(application_id), bytes.fromhex(icon_hash or "0" * 32), icon_hash is not None)
+    body += blob
+
+    atomic_write(path, bytes(body))
+
+
+class NameMap_:
+    """
+    Read only view of an index built by `build_index`, mapping game names, aliases and executables to Discord apps
+
+    The index is memory mapped on the first lookup rather than at import. If it doesn't exist yet, it is built from
+    namemap.json first
+    """
+
+    __slots__ = ("path", "source", "_map", "_keys", "_records", "_blob", "_lock")
+
+    def __init__(self, path: str, source: str) -> None:
+        self.path = path
+        self.source = source
+        self._map: Optional[mmap.mmap] = None
+        self._keys = 0
+        self._records = 0
+        self._blob = 0
+        self._lock = threading.Lock()
+
+    def load(self) -> mmap.mmap:
+        with self._lock:
+            if self._map is None:
+                if not os.path.isfile(self.path):
+                    with open(self.source, "r") as f:
+                        build_index(json.load(f), self.path)
+
+                with open(self.path, "rb") as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+                magic, self._keys, self._records = _HEADER.unpack_from(self._map)
+                assert magic == _MAGIC, f"{self.path} is not a namemap index"
+                self._blob = _HEADER.size + self._keys * _KEY.size + self._records * _RECORD.size
+
+            return self._map
+
+    def find(self, key: str) -> Optional[App]:
+        """
+        Binary searches the index for an exact (normalised) key
+        """
+        data = self.load()
+        needle = key.encode()
+        low, high = 0, self._keys
+
+        while low < high:
+            mid = (low + high) // 2
+            offset, length, record_number = _KEY.unpack_from(data, _HEADER.size + mid * _KEY.size)
+            candidate = data[self._blob + offset : self._blob + offset + length]
+
+            if candidate < needle:
+                low = mid + 1
+            elif candidate > needle:
+                high = mid
+            else:
+                records = _HEADER.size + self._keys * _KEY.size
+                application_id, icon, has_icon = _RECORD.unpack_from(
+                    data, records + record_number * _RECORD.size
+                )
+                return {"application_id": str(application_id), "icon_hash": has_icon and icon.hex() or None}
+
+        return None
+
+    def get(self, name: str) -> Optional[App]:
+        """
+        Looks up a game by its name, one of its aliases, or the name of its executable
+        """
+        name = normalise(name)
+        if (app := self.find(name)) or not looks_executable(name):
+            # Ordinary titles only match exactly; stripping or splitting them could land on an unrelated game
+            return app
+        return next(filter(None, map(self.find, executable_keys(name))), None)
@@ -0,0 +1,95 @@
+import asyncio
+import datetime
+import logging
+from typing import Callable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def floor_minute(time: datetime.datetime) -> datetime.datetime:
+    """
+    Rounds a time down to the start of its minute
+    """
+    return time.replace(second=0, microsecond=0)
+
+
+class MinuteScheduler:
+    """
+    Calls `callback` once for every wall clock minute (UTC), sleeping until each minute boundary rather than polling
+
+    If the loop wakes up late enough to have slept through a boundary, the missed minutes are passed along with the
+    current one so every minute is still sampled exactly once
+    """
+
+    __slots__ = ("callback", "task", "last", "ticks", "missed", "lag", "max_lag")
+
+    def __init__(self, callback: Callable[[List[datetime.datetime]], None]) -> None:
+        """
+        callback | called with the minutes that are due, oldest first. Should return quickly
+        """
+        self.callback = callback
+        self.task: Optional[asyncio.Task] = None
+        # The most recent minute handed to the callback
+        self.last: Optional[datetime.datetime] = None
+
+        self.ticks = 0
+        self.missed = 0
+        # Seconds between a minute boundary and the scheduler actually waking up for it
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self) -> None:
+        if self.task and not self.task.done():
+            # on_ready can fire more than once (e.g. after a reconnect)
+            return
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+
+    def due(self, now: datetime.datetime) -> List[datetime.datetime]:
+        """
+        Returns every minute that has started since the last one handed out, up to and including `now`'s
+        """
+        assert self.last
+        current = floor_minute(now)
+        minutes: List[datetime.datetime] = []
+        minute = self.last + datetime.timedelta(minutes=1)
+
+        while minute <= current:
+            minutes.append(minute)
+            minute += datetime.timedelta(minutes=1)
+
+        return minutes
+
+    async def run(self) -> None:
+        # The current minute has already started, so the first call happens at the next boundary
+        self.last = self.last or floor_minute(datetime.datetime.utcnow())
+
+        while 1:
+            boundary = self.last + datetime.timedelta(minutes=1)
+            delay = (boundary - datetime.datetime.utcnow()).total_seconds()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            now = datetime.datetime.utcnow()
+            minutes = self.due(now)
+
+            if not minutes:
+                # Woke up a hair early (or the clock went backwards), so go back to sleep
+                continue
+
+            self.lag = (now - minutes[-1]).total_seconds()
+            self.max_lag = max(self.max_lag, self.lag)
+            self.missed += len(minutes) - 1
+            self.ticks += 1
+            self.last = minutes[-1]
+
+            if len(minutes) > 1:
+                logger.warning(
+                    "Scheduler woke up %.1fs late, catching up %d missed minutes", self.lag, len(minutes) - 1
+                )
+
+            self.callback(minutes)
@@ -0,0 +1,416 @@
+import os
+import abc
+import json
+import shutil
+import sqlite3
+import datetime
+import logging
+import threading
+from pathlib import Path
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from .store import ActivityStore, MINUTES_PER_DAY
+from .files import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+
+DATA_DIR = f"{Path(__file__).resolve().parents[3]}/data"
+# Which backend tracked members are kept in: "files" (a folder per member) or "sqlite" (one database)
+STORAGE = os.getenv("STORAGE", "files")
+DB_PATH = f"{DATA_DIR}/redqct.db"
+
+Legend = Dict[str, Tuple[int, int, int]]
+Offset = Tuple[int, int]
+
+
+class Storage(abc.ABC):
+    """
+    Where tracked members' UTC offsets, legends, activity and finished graphs are kept
+
+    Every method is blocking. Writes may be held back until `commit`, which is called after every tick. Backends
+    must implement every abstract method, or they can't be instantiated
+    """
+
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def members(self) -> Dict[str, Offset]:
+        """
+        Returns the (hour, minute) UTC offset of every stored member, keyed by id
+        """
+
+    @abc.abstractmethod
+    def add_member(self, id: str, offset: Offset) -> None:
+        """
+        Starts storing a member with an empty legend. Does nothing to the data of a member who is already stored
+        """
+
+    @abc.abstractmethod
+    def remove_members(self, ids: List[str]) -> None:
+        """
+        Deletes everything stored for the given members
+        """
+
+    @abc.abstractmethod
+    def load_legend(self, id: str) -> Legend:
+        """
+        Reads a member's legend, with its entries in the order they were added
+        """
+
+    @abc.abstractmethod
+    def save_legends(self, legends: Dict[str, Legend]) -> None:
+        """
+        Saves a batch of legends keyed by member id, skipping members who are no longer stored
+        """
+
+    @abc.abstractmethod
+    def activity(self, id: str, day: datetime.date) -> ActivityStore:
+        """
+        Loads a member's activity store, creating an empty one for `day` if they don't have one yet
+        """
+
+    @abc.abstractmethod
+    def save_yesterday(self, id: str, png: bytes) -> None:
+        """
+        Saves the graph of a member's finished day
+        """
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.commit()
+
+
+class DirectoryStorage(Storage):
+    """
+    The original layout: a folder per member under `data/`, holding `utc_offset.json`, `legend.json`,
+    `activity_today.bin` and `graph_yesterday.png`, plus `data/index.json` holding every member's offset
+    """
+
+    __slots__ = ("directory", "index_path", "offsets", "lock")
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.index_path = f"{directory}/index.json"
+        self.offsets: Dict[str, Offset] = {}
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def read_index(self) -> Dict[str, Offset]:
+        """
+        Reads `data/index.json`, or nothing if it's missing or broken
+        """
+        try:
+            with open(self.index_path, "r") as f:
+                raw: Dict[str, Dict[str, int]] = json.load(f)
+            return {id: (offset["h_off"], offset["m_off"]) for id, offset in raw.items()}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Couldn't read %s, falling back to members' folders: %r", self.index_path, e)
+            return {}
+
+    def read_offset(self, id: str) -> Optional[Offset]:
+        """
+        Reads a member's UTC offset from their own folder. A member whose offset can't be read is skipped, rather
+        than stopping everyone else from loading
+        """
+        try:
+            with open(f"{self.directory}/{id}/utc_offset.json", "r") as f:
+                offset_data = json.load(f)
+            return (offset_data["h_off"], offset_data["m_off"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Couldn't load member %s: %r", id, e)
+            return None
+
+    def save_index(self) -> None:
+        with self.lock:
+            index = {id: {"h_off": h_off, "m_off": m_off} for id, (h_off, m_off) in self.offsets.items()}
+
+        atomic_write(self.index_path, json.dumps(index))
+
+    def members(self) -> Dict[str, Offset]:
+        # Member folders are named after their ids; anything else (e.g. the remote cache) isn't a member
+        ids = [
+            id
+            for id in os.listdir(self.directory)
+            if id.isdigit() and os.path.isdir(f"{self.directory}/{id}")
+        ]
+        index = self.read_index()
+
+        # Members missing from the index (e.g. tracked before it existed) have their offsets read in parallel
+        missing = [id for id in ids if id not in index]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for id, offset in zip(missing, pool.map(self.read_offset, missing)):
+                if offset:
+                    index[id] = offset
+
+        with self.lock:
+            self.offsets = {id: index[id] for id in ids if id in index}
+        self.save_index()
+
+        return dict(self.offsets)
+
+    def add_member(self, id: str, offset: Offset) -> None:
+        member_dir = f"{self.directory}/{id}"
+
+        if not os.path.isdir(member_dir):
+            os.mkdir(member_dir)
+
+            with open(f"{member_dir}/utc_offset.json", "w") as f:
+                json.dump({"h_off": offset[0], "m_off": offset[1]}, f)
+
+            with open(f"{member_dir}/legend.json", "w") as f:
+                json.dump({}, f)
+
+        with self.lock:
+            self.offsets[id] = offset
+        self.save_index()
+
+    def remove_members(self, ids: List[str]) -> None:
+        with self.lock:
+            for id in ids:
+                self.offsets.pop(id, None)
+        self.save_index()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(
+                pool.map(partial(shutil.rmtree, ignore_errors=True), [f"{self.directory}/{id}" for id in ids])
+            )
+
+    def load_legend(self, id: str) -> Legend:
+        with open(f"{self.directory}/{id}/legend.json", "r") as f:
+            raw: Dict[str, List[int]] = json.load(f)
+        # Comprehend the List[int] into Tuple[int, int, int]
+        return {k: (raw[k][0], raw[k][1], raw[k][2]) for k in raw}
+
+    def save_legends(self, legends: Dict[str, Legend]) -> None:
+        for id, legend in legends.items():
+            if not os.path.isdir(member_dir := f"{self.directory}/{id}"):
+                # The member was untracked after their legend was staged
+                continue
+
+            atomic_write(f"{member_dir}/legend.json", json.dumps(legend))
+
+    def activity(self, id: str, day: datetime.date) -> ActivityStore:
+        path = f"{self.directory}/{id}/activity_today.bin"
+        return ActivityStore.load(path) or ActivityStore.create(path, day)
+
+    def save_yesterday(self, id: str, png: bytes) -> None:
+        with open(f"{self.directory}/{id}/graph_yesterday.png", "wb") as f:
+            f.write(png)
+
+
+class SQLiteActivityStore(ActivityStore):
+    """
+    An activity store whose minutes are rows in a `SQLiteStorage` database rather than a log file
+    """
+
+    __slots__ = ("db", "member")
+
+    def __init__(self, db: "SQLiteStorage", member: str, day: datetime.date) -> None:
+        super().__init__(db.path, day)
+        self.db = db
+        self.member = member
+
+    def write_header(self) -> None:
+        self.db.queue("DELETE FROM activity WHERE member = ?", (self.member,))
+        self.db.queue("UPDATE members SET day = ? WHERE id = ?", (self.day.toordinal(), self.member))
+
+    def write_records(self, records: List[Tuple[int, int]]) -> None:
+        for minute, _ in records:
+            # Rows hold the minute's whole bitset, so a write never has to read the old row first
+            bits = self.slots[minute]
+            self.db.queue(
+                "INSERT OR REPLACE INTO activity SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM members WHERE id = ?)",
+                (self.member, minute, bits.to_bytes((bits.bit_length() + 7) // 8, "little"), self.member),
+            )
+
+    def write_all(self) -> None:
+        self.write_header()
+        self.write_records(list(self.active()))
+
+
+class SQLiteStorage(Storage):
+    """
+    Every member in one SQLite database in WAL mode, with a row per active minute. Finished graphs have a table of
+    their own, so the members table stays small and saving a legend never rewrites a PNG
+
+    Writes are queued as they happen and applied in a single transaction by `commit`, so a tick costs one commit
+    however many members it touched
+    """
+
+    __slots__ = ("path", "connection", "lock", "writes")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # Shared between the tick's worker threads, so every use of it goes through `self.lock`
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        self.writes: List[Tuple[str, Tuple[Any, ...]]] = []
+
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            # WAL is still consistent after a crash at this level; only the last commits can be lost
+            self.connection.execute("PRAGMA synchronous = NORMAL")
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS members (
+                    id TEXT PRIMARY KEY,
+                    h_off INTEGER NOT NULL,
+                    m_off INTEGER NOT NULL,
+                    legend TEXT NOT NULL DEFAULT '{}',
+                    day INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS activity (
+                    member TEXT NOT NULL,
+                    minute INTEGER NOT NULL,
+                    bits BLOB NOT NULL,
+                    PRIMARY KEY (member, minute)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS yesterday (
+                    member TEXT PRIMARY KEY,
+                    png BLOB NOT NULL
+                );
+                """
+            )
+
+            # Databases from before the yesterday table kept the graph in the members row. Move it out
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(members)")]
+            if "yesterday" in columns:
+                self.connection.execute("BEGIN")
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO yesterday SELECT id, yesterday FROM members WHERE yesterday IS NOT NULL"
+                )
+                self.connection.execute("UPDATE members SET yesterday = NULL WHERE yesterday IS NOT NULL")
+                self.connection.execute("COMMIT")
+
+    def queue(self, sql: str, parameters: Tuple[Any, ...]) -> None:
+        with self.lock:
+            self.writes.append((sql, parameters))
+
+    def commit(self) -> None:
+        with self.lock:
+            writes, self.writes = self.writes, []
+            if not writes:
+                return
+
+            self.connection.execute("BEGIN")
+            try:
+                for sql, parameters in writes:
+                    self.connection.execute(sql, parameters)
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def close(self) -> None:
+        self.commit()
+        with self.lock:
+            self.connection.close()
+
+    def members(self) -> Dict[str, Offset]:
+        with self.lock:
+            rows = self.connection.execute("SELECT id, h_off, m_off FROM members").fetchall()
+        return {id: (h_off, m_off) for id, h_off, m_off in rows}
+
+    def add_member(self, id: str, offset: Offset) -> None:
+        # Applied straight away, since the member's writes from here on depend on their row existing
+        self.commit()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO members (id, h_off, m_off) VALUES (?, ?, ?)", (id, *offset)
+            )
+
+    def remove_members(self, ids: List[str]) -> None:
+        for id in ids:
+            self.queue("DELETE FROM activity WHERE member = ?", (id,))
+            self.queue("DELETE FROM yesterday WHERE member = ?", (id,))
+            self.queue("DELETE FROM members WHERE id = ?", (id,))
+        self.commit()
+
+    def load_legend(self, id: str) -> Legend:
+        with self.lock:
+            row = self.connection.execute("SELECT legend FROM members WHERE id = ?", (id,)).fetchone()
+        raw: Dict[str, List[int]] = json.loads(row and row[0] or "{}")
+        return {k: (raw[k][0], raw[k][1], raw[k][2]) for k in raw}
+
+    def save_legends(self, legends: Dict[str, Legend]) -> None:
+        for id, legend in legends.items():
+            self.queue("UPDATE members SET legend = ? WHERE id = ?", (json.dumps(legend), id))
+
+    def activity(self, id: str, day: datetime.date) -> ActivityStore:
+        with self.lock:
+            row = self.connection.execute("SELECT day FROM members WHERE id = ?", (id,)).fetchone()
+            rows = self.connection.execute(
+                "SELECT minute, bits FROM activity WHERE member = ?", (id,)
+            ).fetchall()
+
+        if not row or row[0] is None:
+            store = SQLiteActivityStore(self, id, day)
+            store.reset(day)
+            return store
+
+        store = SQLiteActivityStore(self, id, datetime.date.fromordinal(row[0]))
+        for minute, bits in rows:
+            if 0 <= minute < MINUTES_PER_DAY:
+                store.slots[minute] = int.from_bytes(bits, "little")
+        return store
+
+    def save_yesterday(self, id: str, png: bytes) -> None:
+        self.queue(
+            "INSERT OR REPLACE INTO yesterday SELECT ?, ? WHERE EXISTS (SELECT 1 FROM members WHERE id = ?)",
+            (id, png, id),
+        )
+
+
+def migrate(source: Storage, target: Storage) -> int:
+    """
+    Copies every member from `source` into `target`, returning how many were copied
+    """
+    members = source.members()
+    today = datetime.date.today()
+
+    copied = 0
+
+    for id, offset in members.items():
+        try:
+            legend = source.load_legend(id)
+            activity = source.activity(id, today)
+        except (OSError, ValueError, IndexError, TypeError) as e:
+            logger.warning("Couldn't copy member %s: %r", id, e)
+            continue
+
+        target.add_member(id, offset)
+        target.save_legends({id: legend})
+
+        copy = target.activity(id, activity.day)
+        copy.day = activity.day
+        copy.slots = list(activity.slots)
+        copy.write_all()
+        copied += 1
+
+    target.commit()
+    return copied
+
+
+def open_storage(kind: str = STORAGE) -> Storage:
+    """
+    Opens the configured storage backend. The first time the SQLite backend is opened, members already stored in
+    `data/` folders are copied into it
+    """
+    if kind == "files":
+        return DirectoryStorage(DATA_DIR)
+
+    if kind == "sqlite":
+        os.makedirs(DATA_DIR, exist_ok=True)
+        fresh = not os.path.isfile(DB_PATH)
+        storage = SQLiteStorage(DB_PATH)
+        if fresh and (copied := migrate(DirectoryStorage(DATA_DIR), storage)):
+            logger.info("Copied %d members from %s into %s", copied, DATA_DIR, DB_PATH)
+        return storage
+
+    raise ValueError(f"Unknown storage backend {kind!r}, expected 'files' or 'sqlite'")
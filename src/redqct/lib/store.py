@@ -0,0 +1,172 @@
+import os
+import struct
+import datetime
+from typing import Iterator, List, Optional, Tuple
+from .files import atomic_write
+
+
+MINUTES_PER_DAY = 1440
+
+# A log starts with a header holding a magic and the ordinal of the day it belongs to
+# Every record after it is (minute, n) followed by an n byte little endian bitset
+_HEADER = struct.Struct("<4sI")
+_RECORD = struct.Struct("<HH")
+_MAGIC = b"RQAS"
+
+
+class ActivityStore:
+    """
+    A single day of a member's activity, kept in memory as one bitset per minute and backed by a small append-only log
+
+    Bit `i` of a minute's bitset is set if the `i`th legend entry was active during that minute
+    Records are buffered in memory until `flush` is called
+
+    Storage backends that keep activity elsewhere subclass this and override `write_header`, `write_records` and
+    `write_all`
+    """
+
+    __slots__ = ("path", "day", "slots", "version", "pending", "_buffer")
+
+    def __init__(self, path: str, day: datetime.date) -> None:
+        self.path = path
+        self.day = day
+        self.slots: List[int] = [0] * MINUTES_PER_DAY
+        # Bumped on every change so anything derived from the store can tell when it is stale
+        self.version = 0
+        # Number of records waiting in `_buffer` to be appended to the log
+        self.pending = 0
+        self._buffer: List[Tuple[int, int]] = []
+
+    @classmethod
+    def load(cls, path: str) -> Optional["ActivityStore"]:
+        """
+        Replays the log at `path`, returning None if it doesn't exist or has no valid header
+        """
+        if not os.path.isfile(path):
+            return None
+
+        with open(path, "rb") as f:
+            raw = f.read()
+
+        if len(raw) < _HEADER.size:
+            return None
+
+        magic, ordinal = _HEADER.unpack_from(raw)
+        if magic != _MAGIC:
+            return None
+
+        store = cls(path, datetime.date.fromordinal(ordinal))
+        offset = _HEADER.size
+
+        while offset + _RECORD.size <= len(raw):
+            minute, n = _RECORD.unpack_from(raw, offset)
+            offset += _RECORD.size
+            if offset + n > len(raw) or minute >= MINUTES_PER_DAY:
+                # A torn write from a crash mid-append; everything before it is still good
+                break
+            store.slots[minute] |= int.from_bytes(raw[offset : offset + n], "little")
+            offset += n
+
+        return store
+
+    @classmethod
+    def create(cls, path: str, day: datetime.date) -> "ActivityStore":
+        """
+        Creates a new, empty log at `path` for `day`, replacing any existing one
+        """
+        store = cls(path, day)
+        store.reset(day)
+        return store
+
+    def reset(self, day: datetime.date) -> None:
+        """
+        Clears every minute and starts a fresh log for `day`
+        """
+        self.day = day
+        self.slots = [0] * MINUTES_PER_DAY
+        self.version += 1
+        self.pending = 0
+        self._buffer.clear()
+        self.write_header()
+
+    def record(self, minute: int, bits: int) -> None:
+        """
+        Marks the activities in `bits` as active during `minute` (minutes since local midnight)
+        """
+        assert 0 <= minute < MINUTES_PER_DAY
+
+        if bits == 0 or self.slots[minute] | bits == self.slots[minute]:
+            # Nothing new to store
+            return
+
+        self.slots[minute] |= bits
+        self.version += 1
+
+        self._buffer.append((minute, bits))
+        self.pending += 1
+
+    def flush(self) -> None:
+        """
+        Appends any buffered records to the log
+        """
+        if not self._buffer:
+            return
+
+        self.write_records(self._buffer)
+        self.pending = 0
+        self._buffer.clear()
+
+    def truncate(self, entries: int) -> None:
+        """
+        Drops every bit from `entries` upwards. If any were set, the log is rewritten without them
+        """
+        mask = (1 << entries) - 1
+        if all(bits & mask == bits for bits in self.slots):
+            return
+
+        self.flush()
+        self.slots = [bits & mask for bits in self.slots]
+        self.version += 1
+        self.write_all()
+
+    def active(self) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (minute, bits) for every minute that has at least one activity
+        """
+        for minute, bits in enumerate(self.slots):
+            if bits:
+                yield (minute, bits)
+
+    def write_header(self) -> None:
+        """
+        Starts a new, empty log for `self.day`
+        """
+        with open(self.path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, self.day.toordinal()))
+
+    def write_records(self, records: List[Tuple[int, int]]) -> None:
+        """
+        Appends (minute, bits) records to the log
+        """
+        with open(self.path, "ab") as f:
+            f.write(encode(records))
+
+    def write_all(self) -> None:
+        """
+        Replaces the log with one holding exactly what's in memory
+        """
+        log = _HEADER.pack(_MAGIC, self.day.toordinal()) + encode(list(self.active()))
+
+        # Replaced as a whole so a crash can't lose the whole day
+        atomic_write(self.path, log)
+
+
+def encode(records: List[Tuple[int, int]]) -> bytes:
+    """
+    Packs (minute, bits) records into the log's record format
+    """
+    log = bytearray()
+    for minute, bits in records:
+        raw = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+        log += _RECORD.pack(minute, len(raw)) + raw
+    return bytes(log)
@@ -0,0 +1,142 @@
+import time
+import asyncio
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+from .metrics import REGISTRY
+
+
+logger = logging.getLogger(__name__)
+
+
+Job = Callable[[], None]
+
+TICK_SECONDS = REGISTRY.histogram(
+    "redqct_tick_seconds", "Time taken by each tick, from its jobs starting to all finishing"
+)
+
+
+class TickRunner:
+    """
+    Runs each minute's per-user jobs on a bounded pool of worker threads, off the event loop
+
+    Only one tick is ever in flight. Ticks submitted while one is running are coalesced into a single follow up
+    tick covering all of their minutes, instead of piling up behind each other
+    """
+
+    __slots__ = (
+        "budget",
+        "after",
+        "executor",
+        "task",
+        "pending",
+        "closed",
+        "ticks",
+        "coalesced",
+        "overruns",
+        "failures",
+        "last_duration",
+        "max_duration",
+    )
+
+    def __init__(self, workers: int, budget: float = 60.0, after: Optional[Job] = None) -> None:
+        """
+        workers | maximum number of user jobs allowed to run at once
+        budget  | seconds a tick is allowed to take before it counts as an overrun
+        after   | blocking job run once all of a tick's jobs have finished, e.g. to flush writes they batched up
+        """
+        self.budget = budget
+        self.after = after
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tick")
+        self.task: Optional[asyncio.Task] = None
+        self.pending: List[datetime.datetime] = []
+        # Set by `shutdown`, after which nothing more is scheduled
+        self.closed = False
+
+        self.ticks = 0
+        self.coalesced = 0
+        self.overruns = 0
+        self.failures = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+
+    def submit(
+        self, minutes: List[datetime.datetime], make_jobs: Callable[[List[datetime.datetime]], List[Job]]
+    ) -> None:
+        """
+        Schedules a tick covering `minutes` without waiting for it
+
+        make_jobs | called on the event loop with the minutes to cover, returns the blocking jobs to run
+        """
+        if self.closed:
+            # The executor is gone, so the tick would only fail
+            return
+
+        if self.task and not self.task.done():
+            # The previous tick is still going - fold these minutes into the one that runs after it
+            self.pending.extend(minutes)
+            self.coalesced += 1
+            return
+
+        self.task = asyncio.create_task(self.run(list(minutes), make_jobs))
+
+    async def run(
+        self, minutes: List[datetime.datetime], make_jobs: Callable[[List[datetime.datetime]], List[Job]]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+
+        while minutes:
+            start = time.perf_counter()
+
+            jobs = make_jobs(minutes)
+            results = await asyncio.gather(
+                *[loop.run_in_executor(self.executor, job) for job in jobs], return_exceptions=True
+            )
+
+            # One broken user shouldn't take down everyone else's tick
+            failed = [result for result in results if isinstance(result, BaseException)]
+
+            if self.after:
+                try:
+                    await loop.run_in_executor(self.executor, self.after)
+                except Exception as e:
+                    failed.append(e)
+
+            if failed:
+                # One line per tick rather than per job, since a bug usually breaks every user at once
+                self.failures += len(failed)
+                logger.error(
+                    "%d of %d tick jobs failed, first: %r",
+                    len(failed),
+                    len(jobs),
+                    failed[0],
+                    exc_info=failed[0],
+                )
+
+            duration = time.perf_counter() - start
+            TICK_SECONDS.observe(duration)
+            self.ticks += 1
+            self.last_duration = duration
+            self.max_duration = max(self.max_duration, duration)
+
+            if duration > self.budget:
+                self.overruns += 1
+                logger.warning(
+                    "Tick overran its %ss budget: took %.2fs for %d users", self.budget, duration, len(jobs)
+                )
+            else:
+                logger.debug("Tick of %d minutes took %.3fs for %d users", len(minutes), duration, len(jobs))
+
+            minutes, self.pending = self.pending, []
+
+    def shutdown(self) -> None:
+        """
+        Stops scheduling ticks and waits for any job already running to finish. Blocking
+        """
+        self.closed = True
+        if self.task and not self.task.done():
+            # Jobs already handed to the executor still run to completion below
+            self.task.cancel()
+        self.pending = []
+        self.executor.shutdown(wait=True)
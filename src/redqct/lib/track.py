@@ -1,21 +1,52 @@
+from __future__ import annotations
 import os
-import shutil
 import json
+import threading
+import logging
 from PIL import Image
 import discord
 import datetime
 import random
+import itertools
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Set, Tuple, Optional, Callable, Sequence
+import time
+from functools import partial
 from dotenv import load_dotenv
 from .singleton import singleton
-from .image import generate_empty_graph, extend_legend, draw_legend_entry, draw_minute
+from .image import generate_empty_graph, generate_graph
+from .store import ActivityStore
+from .storage import Storage, open_storage
+from .tick import TickRunner
+from .journal import LegendJournal_
+from .metrics import REGISTRY
+from .lru import LRU
+from .encode import GRAPH
+
+
+logger = logging.getLogger(__name__)
 
 
 load_dotenv()
 bot_guild = os.getenv("BOT_GUILD")
 assert bot_guild
 BOT_GUILD = int(bot_guild)
+# Number of users whose tick work may run at the same time
+TICK_WORKERS = int(os.getenv("TICK_WORKERS", "8"))
+# Most records an unchanged member's activity store may buffer before it is flushed anyway
+FLUSH_EVERY = 15
+
+USER_TICK_SECONDS = REGISTRY.histogram("redqct_user_tick_seconds", "Time taken by a single member's tick job")
+GRAPH_RENDER_SECONDS = REGISTRY.histogram(
+    "redqct_graph_render_seconds", "Time taken to render a member's graph"
+)
+PNG_SECONDS = REGISTRY.histogram("redqct_png_seconds", "Time taken to encode or save a graph PNG", ("op",))
+
+# Rendered graphs as PNG bytes, keyed by (user id, store generation, day, activity store version)
+GRAPHS: LRU[Tuple[str, int, datetime.date, int], bytes] = LRU(maxsize=32)
+# Numbers every activity store a member loads. A store's version starts over when it's reloaded (e.g. the member
+# was untracked and tracked again), so the version alone could match a graph rendered from an older store
+GENERATIONS = itertools.count()
 
 # fmt: off
 PRESETS = {
@@ -45,87 +76,219 @@ with open(f"{Path(__file__).resolve().parents[3]}/distincts.json", "r") as f:
     raw: List[List[int]] = json.load(f)
     DISTINCTS = [(a[0], a[1], a[2]) for a in raw]
 
-    print(DISTINCTS)
+
+def activity_names(activities: Sequence[discord.activity.ActivityTypes]) -> List[str]:
+    """
+    Returns the names of a member's activities as they appear in a graph's legend
+    """
+    names: List[str] = []
+
+    # Spotify doesn't have a .name, so this handles that edge case
+    if any(isinstance(a, discord.Spotify) for a in activities):
+        names.append("Spotify")
+
+    # For every activity, add the name to the names list if it exists
+    names.extend(
+        [
+            a.name
+            for a in activities
+            if (isinstance(a, discord.Activity) or isinstance(a, discord.Game)) and a.name
+        ]
+    )
+
+    return names
+
+
+def png_bytes(image: Image.Image, legend: Optional[Dict[str, Tuple[int, int, int]]] = None) -> bytes:
+    """
+    Encodes a graph, keeping the colours of its legend exact
+    """
+    with PNG_SECONDS.time("encode"):
+        return GRAPH.encode(image, (legend or {}).values())
 
 
 @singleton
 class Users_:
     """
-    Singleton structure that acts on a List[TrackedUser]
+    Singleton structure that acts on the tracked members, keyed by their id
     """
 
-    def __init__(self, bot: discord.Client) -> None:
-        self.users: List[TrackedUser] = []
+    def __init__(self, bot: discord.Client, storage: Optional[Storage] = None) -> None:
+        self.users: Dict[str, TrackedUser] = {}
         self.bot = bot
+        self.storage = storage or open_storage()
+        self.journal = LegendJournal_(self.storage.save_legends)
+        # Everything written during a tick is saved together once every user's job is done
+        self.ticker = TickRunner(workers=TICK_WORKERS, after=self.commit)
+        # Whether `load_existing` has run
+        self.loaded = False
 
     def load_existing(self) -> None:
         """
-        Checks through `data/`, loading any currently tracked members into `self.users`
+        Loads every member kept in `self.storage` into `self.users`, deleting the data of anyone who has left the
+        server
+
+        Only ids and UTC offsets are read here. Each member's legend and activity are loaded the first time they are
+        needed, so startup doesn't scale with how much every member has recorded
         """
-        data_dir = f"{Path(__file__).resolve().parents[3]}/data"
+        if self.loaded:
+            # on_ready can fire more than once (e.g. after a reconnect), and reloading would replace live members
+            return
+
         guild = self.bot.get_guild(BOT_GUILD)
         assert guild
-
-        ids = os.listdir(data_dir)
-        for id in ids:
-            if os.path.isdir(f"{data_dir}/{id}"):
-                # E Dorm guild ID
-                if guild.get_member(int(id)):
-                    # Load the member into self.users
-                    with open(f"{data_dir}/{id}/utc_offset.json", "r") as f:
-                        offset_data = json.load(f)
-
-                    with open(f"{data_dir}/{id}/legend.json", "r") as f:
-                        raw: Dict[str, List[int]] = json.load(f)
-                        # Comprehend the List[int] into Tuple[int, int, int]
-                        legend_data: Dict[str, Tuple[int, int, int]] = {
-                            k: (raw[k][0], raw[k][1], raw[k][2]) for k in raw
-                        }
-
-                    self.track(str(id), offset_data["h_off"], offset_data["m_off"], legend_data)
-                else:
-                    # Member is not in the server - delete their data folder and its contents
-                    shutil.rmtree(f"{data_dir}/{id}")
-
-        print("Load existing succeeded")
+        self.loaded = True
+        timings: Dict[str, float] = {}
+        start = last = time.perf_counter()
+
+        def phase(name: str) -> None:
+            nonlocal last
+            now = time.perf_counter()
+            timings[name] = now - last
+            last = now
+
+        offsets = self.storage.members()
+        phase("read")
+
+        gone: List[str] = []
+        for id, (h_off, m_off) in offsets.items():
+            if id in self.users:
+                # Already tracked, e.g. by a command that ran before the bot was ready
+                continue
+            # E Dorm guild ID
+            if guild.get_member(int(id)):
+                self.track(id, h_off, m_off, lazy=True)
+            else:
+                gone.append(id)
+        phase("members")
+
+        # Member is not in the server - delete their data
+        if gone:
+            self.storage.remove_members(gone)
+        phase("cleanup")
+
+        report = ", ".join(f"{name} {duration:.3f}s" for name, duration in timings.items())
+        logger.info(
+            "Load existing succeeded: %d members in %.3fs (%s)",
+            len(self.users),
+            time.perf_counter() - start,
+            report,
+        )
 
     def exists(self, id: int) -> bool:
         """
         Checks if an user is being currently tracked
         """
-        return any(user.id == str(id) for user in self.users)
+        return str(id) in self.users
+
+    def get(self, id: int) -> Optional[TrackedUser]:
+        """
+        Returns the tracked user with the given id, if they are being tracked
+        """
+        return self.users.get(str(id))
 
     def track(
         self,
         user: str,
         h_off: int,
         m_off: int,
-        legend_data: Optional[Dict[str, Tuple[int, int, int]]] = None,
+        lazy: bool = False,
     ) -> None:
-        self.users.append(
-            TrackedUser(
-                bot=self.bot,
-                id=str(user),
-                utc_offset_h=h_off,
-                utc_offset_m=m_off,
-                legend=legend_data,
-            )
+        """
+        lazy | whether to put off loading the member's data until it's first needed, as when loading at startup
+        """
+        if not lazy:
+            self.storage.add_member(str(user), (h_off, m_off))
+
+        tracked = TrackedUser(
+            bot=self.bot,
+            storage=self.storage,
+            journal=self.journal,
+            id=str(user),
+            utc_offset_h=h_off,
+            utc_offset_m=m_off,
+            lazy=lazy,
         )
 
+        # Seed the member's activities; from here on they are kept up to date by presence updates
+        guild = self.bot.get_guild(BOT_GUILD)
+        member = guild and guild.get_member(int(user))
+        if member:
+            tracked.set_activities(activity_names(member.activities))
+
+        self.users[tracked.id] = tracked
+
+    def on_presence_update(self, member: discord.Member) -> None:
+        """
+        Should be called with the updated member whenever a member's presence changes
+        """
+        if member.guild.id != BOT_GUILD:
+            return
+
+        if user := self.get(member.id):
+            user.set_activities(activity_names(member.activities))
+
     def untrack(self, user: int) -> None:
-        target_user = [u for u in self.users if u.id == str(user)][0]
-        self.users.remove(target_user)
-        # Delete the member's data folder and its contents
-        if os.path.isdir(dir := f"{Path(__file__).resolve().parents[3]}/data/{user}"):
-            shutil.rmtree(dir)
+        if (tracked := self.users.pop(str(user), None)) is None:
+            return
+
+        # Waits for a tick already running for the member, and stops any still queued, so nothing writes their
+        # data back after it's deleted. Only ever held for one member's tick, so it's fine on the event loop
+        with tracked.lock:
+            tracked.removed = True
+            self.journal.discard(tracked.id)
+            # Delete the member's data
+            self.storage.remove_members([tracked.id])
+
+    def commit(self) -> None:
+        """
+        Saves the legends staged since the last commit, then commits everything the storage backend held back.
+        Blocking; run after every tick
+        """
+        # Summarised here rather than logged as each member picks up an entry
+        if saved := self.journal.flush():
+            logger.debug("Saved %d changed legends", saved)
+        self.storage.commit()
 
-    async def update_graphs(self) -> None:
+    def close(self) -> None:
         """
-        Should be called every minute by a discord bot loop
+        Saves anything still pending and closes the storage backend. Blocking
         """
-        for user in self.users:
-            await user.check_clear()
-            await user.update_graph(ctx=self)
+        self.ticker.shutdown()
+
+        # Unchanged activity is only flushed every FLUSH_EVERY minutes, so some of it is still buffered
+        for user in list(self.users.values()):
+            with user.lock:
+                if user.loaded:
+                    user.store.flush()
+
+        self.commit()
+        self.storage.close()
+
+    def update_graphs(self, minutes: List[datetime.datetime]) -> None:
+        """
+        Should be called every minute by a scheduler. Returns straight away; the work runs on `self.ticker`
+
+        minutes | the UTC minutes being recorded, usually just the current one
+        """
+        self.ticker.submit(minutes, self.prepare_tick)
+
+    def prepare_tick(self, minutes: List[datetime.datetime]) -> List[Callable[[], None]]:
+        """
+        Snapshots tracked members' activities on the event loop and returns one blocking job per user with
+        something to record. Members doing nothing are skipped entirely
+        """
+        jobs: List[Callable[[], None]] = []
+
+        for user in self.users.values():
+            if not user.activities and not user.dirty:
+                continue
+
+            # Only users whose activities changed since the last tick need to persist straight away
+            jobs.append(partial(user.tick, minutes, list(user.activities), user.dirty))
+            user.dirty = False
+
+        return jobs
 
 
 class TrackedUser:
@@ -135,218 +298,264 @@ class TrackedUser:
 
     __slots__ = (
         "bot",
+        "storage",
+        "journal",
         "name",
         "tag",
         "id",
         "utc_offset_h",
         "utc_offset_m",
         "legend",
+        "colours",
+        "next_distinct",
+        "store",
+        "generation",
+        "lock",
+        "activities",
+        "dirty",
+        "loaded",
+        "removed",
     )
 
     def __init__(
         self,
         bot: discord.Client,
+        storage: Storage,
+        journal: LegendJournal_,
         id: str,
         utc_offset_h: int,
         utc_offset_m: int,
-        legend: Optional[Dict[str, Tuple[int, int, int]]] = None,
+        lazy: bool = False,
     ) -> None:
         user = bot.get_user(int(id))
         self.bot = bot
+        self.storage = storage
+        self.journal = journal
         self.name = user and user.name or "NULL"
         self.tag = user and user.discriminator or "NULL"
         self.id = id
         self.utc_offset_h = utc_offset_h
         self.utc_offset_m = utc_offset_m
 
-        self.legend = legend or dict()
-        self.setup_dir()
-
-    def setup_dir(self) -> None:
-        """
-        Creates a new directory entry in `data/` and populates it if it doesn't already exist
-        """
-        root_dir = Path(__file__).resolve().parents[3]
-        data_dir = f"{root_dir}/data/{self.id}"
-
-        if not os.path.isdir(data_dir):
-            os.mkdir(data_dir)
-
-            with open(f"{data_dir}/utc_offset.json", "w") as f:
-                json.dump(
-                    {
-                        "h_off": self.utc_offset_h,
-                        "m_off": self.utc_offset_m,
-                    },
-                    f,
-                )
-
-            with open(f"{data_dir}/legend.json", "w") as f:
-                json.dump({}, f)
+        self.legend: Dict[str, Tuple[int, int, int]] = dict()
+        # Colours already in the legend, and how far into DISTINCTS every colour is known to be taken
+        self.colours: Set[Tuple[int, int, int]] = set()
+        self.next_distinct = 0
+        # Held while the member's data is being changed or rendered, since ticks run on worker threads
+        self.lock = threading.Lock()
+        # The member's current activities, and whether they have changed since the last tick
+        self.activities: Tuple[str, ...] = ()
+        self.dirty = False
+        # Whether the member's legend and activity store have been loaded
+        self.loaded = False
+        # Set once the member is untracked, after which their data must not be written again
+        self.removed = False
+
+        if not lazy:
+            self.load()
 
             yesterday = generate_empty_graph(
                 self.name,
                 self.tag,
-                datetime.datetime.utcnow()
-                + datetime.timedelta(hours=self.utc_offset_h - 24, minutes=self.utc_offset_m),
-                self.utc_offset_h,
-                self.utc_offset_m,
-            )
-            today = generate_empty_graph(
-                self.name,
-                self.tag,
-                datetime.datetime.utcnow()
-                + datetime.timedelta(hours=self.utc_offset_h, minutes=self.utc_offset_m),
+                self.local_now() - datetime.timedelta(days=1),
                 self.utc_offset_h,
                 self.utc_offset_m,
             )
+            png = png_bytes(yesterday)
+            with PNG_SECONDS.time("save"):
+                self.storage.save_yesterday(self.id, png)
 
-            # print(yesterday)
-            # print(today)
+    def load(self) -> None:
+        """
+        Reads the member's legend and activity from storage. Blocking
+        """
+        try:
+            self.legend = self.storage.load_legend(self.id)
+        except (OSError, ValueError, IndexError, TypeError) as e:
+            logger.warning("Couldn't read the legend of member %s, starting a new one: %r", self.id, e)
+            self.legend = dict()
 
-            yesterday.save(f"{data_dir}/graph_yesterday.png")
-            today.save(f"{data_dir}/graph_today.png")
+        self.colours = set(self.legend.values())
+        self.next_distinct = 0
 
-    def check_new_entry(self, activity_name: str) -> None:
-        print(activity_name)
+        self.store: ActivityStore = self.storage.activity(self.id, self.local_now().date())
+        self.generation = next(GENERATIONS)
+        # The legend is written behind the activity log, so a crash can leave bits for entries it never saved.
+        # Drop them, or they'd be attributed to whichever activity takes that entry next
+        self.store.truncate(len(self.legend))
+        self.loaded = True
 
+    def local_now(self, now: Optional[datetime.datetime] = None) -> datetime.datetime:
+        """
+        Returns the current time (or `now`, in UTC) relative to the member's UTC offset
+        """
+        return (now or datetime.datetime.utcnow()) + datetime.timedelta(
+            hours=self.utc_offset_h, minutes=self.utc_offset_m
+        )
+
+    def check_new_entry(self, activity_name: str) -> None:
         if activity_name in self.legend:
             return
 
-        assigned = False
+        self.legend[activity_name] = colour = self.free_colour(activity_name)
+        logger.debug("New legend entry for member %s: %s", self.id, activity_name)
+        self.colours.add(colour)
+
+        # The legend entry itself is drawn whenever the graph is rendered, so only the legend needs saving.
+        # That's left to the journal, which writes it after the tick along with everyone else's
+        self.journal.stage(self.id, self.legend)
 
-        # Check to assign a preset colour
+    def free_colour(self, activity_name: str) -> Tuple[int, int, int]:
+        """
+        Picks the colour for a new legend entry: its preset if it has one, otherwise the first pastel colour that
+        hasn't been assigned, otherwise a random colour that hasn't been assigned
+        """
         if activity_name in PRESETS:
-            self.legend[activity_name] = PRESETS[activity_name]
-            assigned = True
+            return PRESETS[activity_name]
 
-        # Assign a pastel colour that hasn't been already assigned
-        if not assigned:
-            for colour in DISTINCTS:
-                if not (colour in self.legend.values()):
-                    self.legend[activity_name] = colour
-                    assigned = True
-                    break
+        # Colours are never freed until the legend is reset, so anything before the cursor stays taken
+        while self.next_distinct < len(DISTINCTS):
+            colour = DISTINCTS[self.next_distinct]
+            self.next_distinct += 1
+            if colour not in self.colours:
+                return colour
 
         # All the pastel colours have been taken... generate a random non taken colour
-        if not assigned:
-            while 1:
-                r = random.randrange(0, 256)
-                g = random.randrange(0, 256)
-                b = random.randrange(0, 256)
-
-                if not (rgb := (r, g, b)) in self.legend.values():
-                    self.legend[activity_name] = rgb
-                    assigned = True
-                    break
-
-        # By now, activity_name should have a unique colour entry in self.legend
-        assert assigned
-
-        graph_path = f"{Path(__file__).resolve().parents[3]}/data/{self.id}/graph_today.png"
-        graph = Image.open(graph_path)
-
-        if len(self.legend) % 13 == 0 and len(self.legend) != 0:
-            # Stitch a new 430x1080 piece to the right of the current image
-            graph = extend_legend(graph)
-            print("Extended graph!")
-
-        # Calculate coords of the new legend entry to be drawn
-        base_x, base_y = 1538, 210
-        dx, dy = 430, 60
-        entries = len(self.legend)
-        vertical_pos = entries % 13
-        n_slice = entries // 13
-        coords = (base_x + dx * n_slice, base_y + dy * (vertical_pos - 1))
-
-        draw_legend_entry(
-            graph=graph,
-            colour=self.legend[activity_name],
-            text=activity_name,
-            coords=coords,
+        while 1:
+            rgb = (random.randrange(0, 256), random.randrange(0, 256), random.randrange(0, 256))
+            if rgb not in self.colours:
+                return rgb
+
+    def render_graph(self) -> Image.Image:
+        """
+        Renders the graph of the day currently held in the member's activity store
+        """
+        names = list(self.legend)
+        minutes = (
+            (minute, [name for i, name in enumerate(names) if bits >> i & 1])
+            for minute, bits in self.store.active()
+        )
+
+        return generate_graph(
+            self.name,
+            self.tag,
+            datetime.datetime.combine(self.store.day, datetime.time()),
+            self.utc_offset_h,
+            self.utc_offset_m,
+            self.legend,
+            minutes,
         )
 
-        graph.save(graph_path)
+    def graph_png(self) -> Optional[bytes]:
+        """
+        Returns the member's graph for their current day as PNG bytes, only rendering it if the member's activity
+        has changed since it was last asked for. Safe to call while a tick is running
+
+        Returns None if the member was untracked in the meantime, since their data is gone
+        """
+        with self.lock:
+            if self.removed:
+                return None
+
+            if not self.loaded:
+                self.load()
 
-        data_dir = f"{Path(__file__).resolve().parents[3]}/data/{self.id}"
+            self.check_clear(datetime.datetime.utcnow())
+            key = (self.id, self.generation, self.store.day, self.store.version)
 
-        with open(f"{data_dir}/legend.json", "w") as f:
-            json.dump(self.legend, f)
+            if (png := GRAPHS.get(key)) is None:
+                with GRAPH_RENDER_SECONDS.time():
+                    graph = self.render_graph()
+                png = png_bytes(graph, self.legend)
+                GRAPHS.put(key, png)
 
-    async def check_clear(self) -> None:
+            return png
+
+    def set_activities(self, activity_names: List[str]) -> None:
         """
-        Clears the member's graph if it's midnight according to their UTC offset. Stores the cleared graph for one day as `graph_yesterday.png, and resets the legend`
+        Updates the member's current activities, marking them dirty if anything changed
         """
-        now = datetime.datetime.utcnow() + datetime.timedelta(
-            hours=self.utc_offset_h, minutes=self.utc_offset_m
-        )
+        activities = tuple(activity_names)
 
-        root_dir = Path(__file__).resolve().parents[3]
-        data_dir = f"{root_dir}/data/{self.id}"
+        if activities != self.activities:
+            self.activities = activities
+            self.dirty = True
 
-        if now.hour == 0 and now.minute == 0:
-            # It's Midnight - store the graph and then reset it
-            shutil.copy(f"{data_dir}/graph_today.png", f"{data_dir}/graph_yesterday.png")
+    def tick(self, minutes: List[datetime.datetime], activity_names: List[str], changed: bool) -> None:
+        """
+        Runs a tick's worth of work for the member. Blocking, so it is run on a worker thread
 
-            today = generate_empty_graph(
-                self.name,
-                self.tag,
-                datetime.datetime.utcnow()
-                + datetime.timedelta(hours=self.utc_offset_h, minutes=self.utc_offset_m),
-                self.utc_offset_h,
-                self.utc_offset_m,
-            )
+        minutes         | UTC minutes to record `activity_names` against
+        activity_names  | the member's activities, snapshotted when the tick started
+        changed         | whether the activities changed since the last tick
+        """
+        with self.lock, USER_TICK_SECONDS.time():
+            if self.removed:
+                # Untracked after this tick was prepared
+                return
 
-            today.save(f"{data_dir}/graph_today.png")
+            if not self.loaded:
+                self.load()
 
-            # Reset legend
-            self.legend = dict()
-            with open(f"{data_dir}/legend.json", "w") as f:
-                json.dump({}, f)
-
-    async def update_graph(self, ctx: Users_) -> None:
-        """ """
-        # Get the current time relative to the user's desired utc offset
-        # Get the user's current activities via the bot
-        # Draw a 1px line at that specific time in a specific colour depending on the activities present now
-        guild = self.bot.get_guild(BOT_GUILD)
-        assert guild
-        member = guild.get_member(int(self.id))
+            for minute in minutes:
+                self.check_clear(minute)
+                self.update_graph(minute, activity_names)
+
+            # Unchanged activity is only written out every so often, bounding what a crash can lose
+            if changed or self.store.pending >= FLUSH_EVERY:
+                self.store.flush()
+
+    def check_clear(self, now: datetime.datetime) -> None:
+        """
+        Clears the member's activity if a new day has started according to their UTC offset. Renders the finished day as yesterday's graph, and resets the legend
+        """
+        today = self.local_now(now).date()
 
-        if not member:
-            ctx.untrack(int(self.id))
+        if self.store.day == today:
             return
 
-        # Member exists
-        activity_names: List[str] = []
+        yesterday = today - datetime.timedelta(days=1)
 
-        # Spotify doesn't have a .name, so this handles that edge case
-        if any(isinstance(a, discord.Spotify) for a in member.activities):
-            activity_names.append("Spotify")
+        legend = None
 
-        # For every activity, add the name to the activity_names list if it exists
-        activity_names.extend(
-            [
-                a.name
-                for a in member.activities
-                if (isinstance(a, discord.Activity) or isinstance(a, discord.Game)) and a.name
-            ]
-        )
+        if self.store.day == yesterday:
+            # It's past midnight - store the finished graph and then reset it
+            with GRAPH_RENDER_SECONDS.time():
+                graph = self.render_graph()
+            legend = self.legend
+        else:
+            # Nothing was tracked yesterday (e.g. the bot was down), so yesterday's graph is empty
+            graph = generate_empty_graph(
+                self.name,
+                self.tag,
+                datetime.datetime.combine(yesterday, datetime.time()),
+                self.utc_offset_h,
+                self.utc_offset_m,
+            )
+
+        png = png_bytes(graph, legend)
+        with PNG_SECONDS.time("save"):
+            self.storage.save_yesterday(self.id, png)
+        self.store.reset(today)
 
+        # Reset legend
+        self.legend = dict()
+        self.colours = set()
+        self.next_distinct = 0
+        self.journal.stage(self.id, self.legend)
+
+    def update_graph(self, now: datetime.datetime, activity_names: List[str]) -> None:
+        """
+        Records the member's activities against the minute of their day that `now` (UTC) falls on
+        """
         for activity_name in activity_names:
             self.check_new_entry(activity_name)
 
         if len(activity_names) > 0:
-            # Draw a line for every minute on the graph
-            graph_path = f"{Path(__file__).resolve().parents[3]}/data/{self.id}/graph_today.png"
-            graph = Image.open(graph_path)
-
-            now: datetime.datetime = datetime.datetime.utcnow() + datetime.timedelta(
-                hours=self.utc_offset_h, minutes=self.utc_offset_m
-            )
-
-            x_pos = 49 + (now.hour * 60 + now.minute)
+            local = self.local_now(now)
+            ids = {name: i for i, name in enumerate(self.legend)}
+            bits = 0
+            for activity_name in activity_names:
+                bits |= 1 << ids[activity_name]
 
-            draw_minute(graph=graph, activities=activity_names, legend=self.legend, x=x_pos)
-            print(f"Drew a line to {self.name}#{self.tag}'s graph")
-            graph.save(graph_path)
+            self.store.record(local.hour * 60 + local.minute, bits)
@@ -0,0 +1,74 @@
+import json
+import pytest
+import datetime
+import numpy as np
+from io import BytesIO
+from PIL import Image, ImageDraw
+from redqct.lib.encode import Profile
+from redqct.lib.image import ROOT_DIR, generate_graph
+
+
+@pytest.fixture
+def graph() -> Image.Image:
+    # Flat legend colours on a flat background, like a rendered graph
+    image = Image.new("RGBA", (400, 200), (49, 51, 56, 255))
+    draw = ImageDraw.Draw(image)
+    for i, colour in enumerate([(238, 109, 166), (26, 172, 77), (101, 213, 109)]):
+        draw.rectangle((i * 100, 50, i * 100 + 60, 150), fill=colour)
+    return image
+
+
+def test_palette_png_keeps_flat_colours(graph: Image.Image) -> None:
+    decoded = Image.open(BytesIO(Profile("png", palette=True).encode(graph)))
+
+    assert decoded.format == "PNG"
+    assert decoded.mode == "P"
+    assert decoded.convert("RGB").tobytes() == graph.convert("RGB").tobytes()
+
+
+def test_palette_png_keeps_legend_colours_of_a_real_graph() -> None:
+    with open(f"{ROOT_DIR}/distincts.json", "r") as f:
+        colours = [tuple(colour) for colour in json.load(f)[:24]]
+    legend = {f"Game {i}": colour for i, colour in enumerate(colours)}
+    names = list(legend)
+    minutes = [(minute, [names[minute // 30 % 24], names[minute // 47 % 24]]) for minute in range(1440)]
+    graph = generate_graph("名前 name", "0001", datetime.datetime(2022, 11, 20), 5, 30, legend, minutes)
+
+    decoded = Image.open(BytesIO(Profile("png", palette=True).encode(graph, legend.values())))
+
+    before = np.array(graph.convert("RGB")).reshape(-1, 3)
+    after = np.array(decoded.convert("RGB")).reshape(-1, 3)
+    for colour in colours:
+        drawn = (before == colour).all(axis=1)
+        assert drawn.any()
+        # Every bar and legend key pixel comes out exactly
+        assert (after[drawn] == colour).all()
+    # Only the antialiased text and edges are allowed to shift
+    assert np.abs(before.astype(int) - after).max() < 32
+
+
+def test_palette_png_keeps_legend_colours_that_are_close_together() -> None:
+    colours = [(200, 100, 50), (201, 100, 50), (200, 101, 51)]
+    image = Image.new("RGB", (300, 100), (49, 51, 56))
+    draw = ImageDraw.Draw(image)
+    for i, colour in enumerate(colours):
+        draw.ellipse((i * 100, 0, i * 100 + 99, 99), fill=colour)
+
+    decoded = Image.open(BytesIO(Profile("png", palette=True).encode(image, colours)))
+
+    assert decoded.convert("RGB").tobytes() == image.tobytes()
+
+
+@pytest.mark.parametrize("format", ["png", "webp"])
+def test_truecolour_profiles_are_lossless(graph: Image.Image, format: str) -> None:
+    profile = Profile(format)
+    decoded = Image.open(BytesIO(profile.encode(graph)))
+
+    assert decoded.format == format.upper()
+    assert profile.filename == f"out.{format}"
+    assert decoded.convert("RGBA").tobytes() == graph.tobytes()
+
+
+def test_unknown_format() -> None:
+    with pytest.raises(ValueError):
+        Profile("gif")
@@ -0,0 +1,15 @@
+from pathlib import Path
+from redqct.lib.files import atomic_write
+
+
+def test_atomic_write_replaces_the_whole_file(tmp_path: Path) -> None:
+    path = tmp_path / "legend.json"
+    path.write_text('{"a much longer legend": [1, 2, 3]}')
+
+    atomic_write(str(path), "{}")
+    assert path.read_text() == "{}"
+
+    atomic_write(str(path), b"\x89PNG")
+    assert path.read_bytes() == b"\x89PNG"
+    # Nothing is left behind
+    assert [p.name for p in tmp_path.iterdir()] == ["legend.json"]
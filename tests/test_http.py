@@ -0,0 +1,88 @@
+import time
+import asyncio
+import pytest
+from pathlib import Path
+from typing import Dict, List
+from redqct.lib import http
+from redqct.lib.http import Entry, RemoteCache_, fetch_bytes
+
+
+class FakeResponse:
+    def __init__(self, status: int, body: bytes) -> None:
+        self.status = status
+        self.body = body
+        self.content_type = "image/png"
+        self.headers: Dict[str, str] = {}
+
+    async def read(self) -> bytes:
+        return self.body
+
+    async def __aenter__(self) -> "FakeResponse":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        pass
+
+
+class FakeSession:
+    def __init__(self, *responses: FakeResponse) -> None:
+        self.responses = list(responses)
+        self.requested: List[str] = []
+
+    def get(self, url: str, headers: Dict[str, str]) -> FakeResponse:
+        self.requested.append(url)
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> RemoteCache_:
+    cache = RemoteCache_(str(tmp_path), max_bytes=1024)
+    monkeypatch.setattr(http, "RemoteCache", cache)
+    return cache
+
+
+@pytest.mark.parametrize("status", [500, 503, 429])
+def test_server_errors_serve_the_stale_entry(cache: RemoteCache_, status: int) -> None:
+    cache.put("https://cdn/a.png", Entry(b"old", "etag", None, time.time() - 1))
+    session = FakeSession(FakeResponse(status, b"error page"))
+
+    body, _ = asyncio.run(fetch_bytes(session, "https://cdn/a.png", "a"))  # type: ignore
+
+    assert session.requested == ["https://cdn/a.png"]
+    assert body == b"old"
+
+
+def test_server_errors_without_a_cache_fail(cache: RemoteCache_) -> None:
+    session = FakeSession(FakeResponse(503, b"error page"))
+
+    body, _ = asyncio.run(fetch_bytes(session, "https://cdn/b.png", "b"))  # type: ignore
+
+    assert body == b"error page"
+    assert cache.get("https://cdn/b.png") is None
+
+
+def test_cancelled_caller_doesnt_fail_other_waiters(monkeypatch: pytest.MonkeyPatch) -> None:
+    downloads: List[str] = []
+
+    async def slow_fetch(session, url: str, id: str):
+        downloads.append(url)
+        await asyncio.sleep(0.05)
+        return (b"body", id)
+
+    monkeypatch.setattr(http, "fetch_bytes", slow_fetch)
+    monkeypatch.setattr(http.Session_, "get", lambda self: None)
+    session = http.Session_()
+
+    async def main() -> bytes:
+        first = asyncio.ensure_future(session.fetch("https://cdn/a.png"))
+        second = asyncio.ensure_future(session.fetch("https://cdn/a.png"))
+        await asyncio.sleep(0)
+        # e.g. the first command timed out
+        first.cancel()
+        body = await second
+        assert first.cancelled()
+        return body
+
+    assert asyncio.run(main()) == b"body"
+    assert downloads == ["https://cdn/a.png"]
+    assert session.inflight == {}
@@ -0,0 +1,148 @@
+import asyncio
+import numpy as np
+from io import BytesIO
+from PIL import Image, ImageDraw
+from redqct.lib.image import (
+    ROOT_DIR,
+    ActivitySpec,
+    ActivityTemplate,
+    Cache,
+    CustomActivityTemplate,
+    GraphTemplate,
+    MemberTemplate,
+    Renderer_,
+    SpecsSpec,
+    contains_glyph,
+    coverage,
+    draw_minutes,
+    draw_text,
+    measure_text,
+    render_specs,
+    tinted_banner,
+    truncate,
+)
+
+
+LEGEND = {"a": (255, 0, 0), "b": (0, 255, 0), "c": (0, 0, 255)}
+BLANK = (0, 0, 0, 0)
+
+
+def test_draw_minutes_splits_columns_between_activities() -> None:
+    graph = Image.new("RGBA", (1920, 1080), BLANK)
+    draw_minutes(graph, [(100, ["b", "a"]), (101, ["a"]), (102, ["a", "b", "c"])], LEGEND)
+
+    # Activities are stacked in name order, each taking an equal share of the 800px plot starting at y=174
+    assert graph.getpixel((100, 174)) == (255, 0, 0, 255)
+    assert graph.getpixel((100, 573)) == (255, 0, 0, 255)
+    assert graph.getpixel((100, 574)) == (0, 255, 0, 255)
+    assert graph.getpixel((100, 973)) == (0, 255, 0, 255)
+    assert graph.getpixel((101, 500)) == (255, 0, 0, 255)
+    # 800 doesn't divide by 3, so the first two get the spare pixels
+    assert graph.getpixel((102, 174 + 266)) == (255, 0, 0, 255)
+    assert graph.getpixel((102, 174 + 267)) == (0, 255, 0, 255)
+    assert graph.getpixel((102, 174 + 533)) == (0, 255, 0, 255)
+    assert graph.getpixel((102, 174 + 534)) == (0, 0, 255, 255)
+
+    # Nothing outside those columns or the plot area is touched
+    assert graph.getpixel((99, 500)) == BLANK
+    assert graph.getpixel((103, 500)) == BLANK
+    assert graph.getpixel((100, 173)) == BLANK
+    assert graph.getpixel((100, 974)) == BLANK
+
+
+def test_coverage_splits_runs_by_font() -> None:
+    line = "osu! 東京 Tokyo 🎤🎧 ok"
+
+    runs = coverage(line)
+
+    assert runs == (("osu! ", True), ("東京", False), (" Tokyo ", True), ("🎤🎧", False), (" ok", True))
+    # Same answer as checking the font a character at a time
+    assert "".join(run for run, _ in runs) == line
+    assert all(contains_glyph(char) == supported for run, supported in runs for char in run)
+    assert coverage("") == ()
+
+
+def test_draw_text_width_matches_measure_text() -> None:
+    image = Image.new("RGBA", (1300, 100), BLANK)
+    interface = ImageDraw.Draw(image)
+
+    for line in ("osu!", "名前", "YOASOBI - アイドル (Idol) 🎤 feat. 東京 Tokyo", ""):
+        for font, fallback in ((Cache.bold_30, Cache.noto_30), (Cache.reg_25, Cache.noto_25)):
+            width = draw_text(interface, line, (255, 255, 255), (0, 50), font, fallback)
+
+            assert width == measure_text(line, font, fallback)
+
+
+def test_truncate_fits_width_with_ellipsis() -> None:
+    text = "YOASOBI - アイドル (Idol) 🎤 feat. 東京 Tokyo " * 3
+
+    for width in (50, 200, 335):
+        cut = truncate(text, width, Cache.bold_30, Cache.noto_30)
+
+        assert cut.endswith("…")
+        assert text.startswith(cut[:-1])
+        assert measure_text(cut, Cache.bold_30, Cache.noto_30) <= width
+        # It's the longest cut that fits
+        longer = text[: len(cut)] + "…"
+        assert measure_text(longer, Cache.bold_30, Cache.noto_30) > width
+
+    # Text that already fits is left alone
+    assert truncate("osu!", 335, Cache.bold_30, Cache.noto_30) == "osu!"
+
+
+def test_tinted_banner_only_paints_the_banner() -> None:
+    mask = np.array(Cache.banner_mask_v2)
+    inside = tuple(int(i) for i in np.argwhere(mask == 255)[0][::-1])
+    outside = tuple(int(i) for i in np.argwhere(mask == 0)[0][::-1])
+
+    banner = tinted_banner((88, 101, 242))
+
+    assert banner.size == Cache.banner_mask_v2.size
+    assert banner.getpixel(inside) == (88, 101, 242, 255)
+    assert banner.getpixel(outside)[3] == 0
+
+
+def test_templates_match_compositing_on_every_render() -> None:
+    templates = [
+        (MemberTemplate(), "v2/redqct-member-1300x265.png"),
+        (CustomActivityTemplate(), "v2/redqct-customstatus-1300x100.png"),
+        (ActivityTemplate(dummy=True), "v2/redqct-dummy-1300x335.png"),
+        (ActivityTemplate(dummy=False), "v2/redqct-activity-1300x335.png"),
+        (GraphTemplate(), "redqct-graph-empty-template-1920x1080.png"),
+    ]
+
+    for template, path in templates:
+        # What Template.__init__ used to do with the raw image each time
+        raw = Image.open(f"{ROOT_DIR}/assets/{path}")
+        old = Image.alpha_composite(Image.new("RGBA", raw.size), raw.convert("RGBA"))
+
+        assert template._background.mode == "RGBA"
+        assert np.array_equal(np.array(template._background), np.array(old))
+
+
+def png(size: int, colour: tuple) -> bytes:
+    with BytesIO() as bin:
+        Image.new("RGB", (size, size), colour).save(bin, "png")
+        return bin.getvalue()
+
+
+def test_render_specs_is_the_same_in_a_worker() -> None:
+    spec = SpecsSpec(
+        name="名前 name",
+        tag="0001",
+        nick=None,
+        status="online",
+        avatar=png(128, (200, 40, 90)),
+        banner_colour=(88, 101, 242),
+        custom_activity="🎮 grinding",
+        activities=[ActivitySpec("playing", png(64, (20, 180, 90)), None, ("osu!", "Ranked", "", ""))],
+    )
+    renderer = Renderer_(1)
+
+    async def main() -> bytes:
+        try:
+            return await renderer.render(spec)
+        finally:
+            renderer.shutdown()
+
+    assert asyncio.run(main()) == render_specs(spec)[0]
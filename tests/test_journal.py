@@ -0,0 +1,21 @@
+from typing import Dict, List
+from redqct.lib.journal import LegendJournal_, Legend
+
+
+def test_journal_batches_writes() -> None:
+    batches: List[Dict[str, Legend]] = []
+    journal = LegendJournal_(batches.append)
+
+    journal.stage("1", {"osu!": (238, 109, 166)})
+    journal.stage("1", {"osu!": (238, 109, 166), "Neovim": (26, 172, 77)})
+    journal.stage("2", {"Spotify": (101, 213, 109)})
+    journal.stage("3", {"TikTok": (240, 28, 82)})
+    # e.g. because the member was untracked
+    journal.discard("3")
+
+    assert journal.flush() == 2
+    assert batches == [
+        {"1": {"osu!": (238, 109, 166), "Neovim": (26, 172, 77)}, "2": {"Spotify": (101, 213, 109)}}
+    ]
+    assert journal.flush() == 0
+    assert len(batches) == 1
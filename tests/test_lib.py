@@ -1,6 +1,7 @@
 import pytest
 from typing import List
 from redqct.lib import Number, cube
+from redqct.lib.lru import LRU
 
 
 @pytest.fixture
@@ -18,3 +19,17 @@ def test_cube_function(cube_data: List[List[Number]]) -> None:
     assert cubed_ints == [343, 512, 8]
     assert cubed_floats == [551.368, 9.261, 110.592]
     assert cubed_mix == [-1000, 79.507, -620_650_477]
+
+
+def test_lru_evicts_least_recently_used() -> None:
+    cache: LRU[str, int] = LRU(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    # Touching "a" makes "b" the least recently used
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (3, 1)
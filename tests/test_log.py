@@ -0,0 +1,28 @@
+import logging
+from redqct.lib.log import RateLimit
+
+
+def record(message: str, *args: object, level: int = logging.WARNING) -> logging.LogRecord:
+    return logging.LogRecord("redqct.lib.tick", level, __file__, 1, message, args, None)
+
+
+def test_rate_limit_drops_repeats_then_reports_them() -> None:
+    limit = RateLimit(burst=2, window=60.0, sample=1.0)
+
+    # Same template with different arguments counts as the same message
+    passed = [limit.filter(record("Couldn't load member %s", id)) for id in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert limit.filter(record("Something else"))
+
+    # Once the window is over, the next one through says what was dropped
+    limit.window = 0.0
+    again = record("Couldn't load member %s", 6)
+    assert limit.filter(again)
+    assert again.getMessage() == "Couldn't load member 6 (3 more like this were dropped)"
+
+
+def test_rate_limit_samples_debug() -> None:
+    limit = RateLimit(burst=1000, window=60.0, sample=0.0)
+
+    assert not limit.filter(record("New legend entry %s", "osu!", level=logging.DEBUG))
+    assert limit.filter(record("New legend entry %s", "osu!", level=logging.INFO))
@@ -0,0 +1,26 @@
+from redqct.lib.metrics import Registry_
+
+
+def test_registry_renders_prometheus_text() -> None:
+    registry = Registry_()
+    fetches = registry.histogram("fetch_seconds", "Fetch time", ("result",), buckets=(0.1, 1.0))
+    commands = registry.counter("commands_total", "Commands", ("command",))
+    registry.callback("tracked_users", "Tracked", lambda: 3)
+
+    fetches.observe(0.05, "cached")
+    fetches.observe(0.5, "downloaded")
+    fetches.observe(5, "downloaded")
+    commands.inc('say "hi"')
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE fetch_seconds histogram" in lines
+    assert 'fetch_seconds_bucket{result="cached",le="0.1"} 1' in lines
+    # Buckets are cumulative
+    assert 'fetch_seconds_bucket{result="downloaded",le="0.1"} 0' in lines
+    assert 'fetch_seconds_bucket{result="downloaded",le="1"} 1' in lines
+    assert 'fetch_seconds_bucket{result="downloaded",le="+Inf"} 2' in lines
+    assert 'fetch_seconds_sum{result="downloaded"} 5.5' in lines
+    assert 'fetch_seconds_count{result="downloaded"} 2' in lines
+    assert 'commands_total{command="say \\"hi\\""} 1' in lines
+    assert "tracked_users 3" in lines
@@ -0,0 +1,99 @@
+import json
+import pytest
+from pathlib import Path
+from redqct.lib.namemap import NameMap_, build_index, build_namemap, iter_array
+
+
+DIVINITY = {
+    "id": "1",
+    "name": "Divinity Original Sin 2",
+    "icon": "6c018443f2c3067bf660d8b55ff9eb20",
+    "aliases": ["Divinity - Original Sin 2"],
+    "executables": [{"is_launcher": False, "name": "divinity original sin 2/bin/eocapp.exe", "os": "win32"}],
+}
+SOULWORKER_OLD = {
+    "id": "2",
+    "name": "SoulWorker",
+    "icon": None,
+    "executables": [{"is_launcher": True, "name": "launcher.exe"}],
+}
+SOULWORKER = {"id": "3", "name": "SoulWorker", "icon": "e84fa7cfb72e2dbb26e373d49491dd48"}
+
+
+@pytest.fixture
+def detectable(tmp_path: Path) -> Path:
+    path = tmp_path / "detectable.json"
+    path.write_text(json.dumps([DIVINITY, SOULWORKER_OLD, SOULWORKER], indent=2))
+    return path
+
+
+@pytest.fixture
+def namemap(tmp_path: Path, detectable: Path) -> NameMap_:
+    build_namemap(str(detectable), str(tmp_path / "namemap.json"), str(tmp_path / "namemap.idx"))
+    return NameMap_(str(tmp_path / "namemap.idx"), str(tmp_path / "namemap.json"))
+
+
+def test_iter_array_streams_elements(detectable: Path) -> None:
+    # A tiny chunk size forces elements to be split across reads
+    assert list(iter_array(str(detectable), chunk_size=7)) == [DIVINITY, SOULWORKER_OLD, SOULWORKER]
+
+
+def test_lookup_by_name_alias_and_executable(namemap: NameMap_) -> None:
+    divinity = {"application_id": "1", "icon_hash": "6c018443f2c3067bf660d8b55ff9eb20"}
+
+    assert namemap.get("Divinity Original Sin 2") == divinity
+    assert namemap.get("divinity  original sin 2") == divinity
+    assert namemap.get("Divinity - Original Sin 2") == divinity
+    assert namemap.get("eocapp.exe") == divinity
+    assert namemap.get("EoCApp") == divinity
+    assert namemap.get("Some Other Game") is None
+    assert namemap.get("C:\\Games\\Divinity Original Sin 2\\bin\\EoCApp.exe") == divinity
+
+
+def test_titles_dont_fall_back_to_executable_keys(namemap: NameMap_) -> None:
+    # Stripping ".5" as if it were an extension would match Divinity
+    assert namemap.get("Divinity Original Sin 2.5") is None
+    assert namemap.get("EoCApp.Remastered") is None
+
+
+def test_duplicate_names_and_launchers(namemap: NameMap_) -> None:
+    # The last app with a name wins, like namemap.json always did
+    assert namemap.get("SoulWorker") == {
+        "application_id": "3",
+        "icon_hash": "e84fa7cfb72e2dbb26e373d49491dd48",
+    }
+    assert namemap.get("launcher.exe") is None
+
+
+def test_rebuild_only_applies_changes(tmp_path: Path, detectable: Path) -> None:
+    paths = (str(detectable), str(tmp_path / "namemap.json"), str(tmp_path / "namemap.idx"))
+
+    assert build_namemap(*paths) == (2, 0, 0)
+    assert build_namemap(*paths) == (0, 0, 0)
+
+    detectable.write_text(
+        json.dumps([{**SOULWORKER, "icon": None}, {"id": "4", "name": "Neovim", "icon": None}])
+    )
+
+    assert build_namemap(*paths) == (1, 1, 1)
+    assert list(json.loads((tmp_path / "namemap.json").read_text())) == ["SoulWorker", "Neovim"]
+
+
+def test_missing_index_is_built_on_first_lookup(tmp_path: Path) -> None:
+    (tmp_path / "namemap.json").write_text(
+        json.dumps(
+            {"Neovim": {"application_id": "4", "icon_hash": None, "aliases": ["nvim"], "executables": []}}
+        )
+    )
+    namemap = NameMap_(str(tmp_path / "namemap.idx"), str(tmp_path / "namemap.json"))
+
+    assert namemap.get("nvim") == {"application_id": "4", "icon_hash": None}
+
+
+def test_build_index_directly(tmp_path: Path) -> None:
+    build_index({"osu!": {"application_id": "5", "icon_hash": None}}, str(tmp_path / "namemap.idx"))
+
+    assert NameMap_(str(tmp_path / "namemap.idx"), "").get("OSU!") == {
+        "application_id": "5",
+        "icon_hash": None,
+    }
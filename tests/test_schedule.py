@@ -0,0 +1,23 @@
+import datetime
+from redqct.lib.schedule import MinuteScheduler, floor_minute
+
+
+def test_due_minutes_catch_up() -> None:
+    scheduler = MinuteScheduler(lambda _: None)
+    scheduler.last = datetime.datetime(2022, 11, 20, 23, 58)
+
+    on_time = scheduler.due(datetime.datetime(2022, 11, 20, 23, 59, 0, 300))
+    late = scheduler.due(datetime.datetime(2022, 11, 21, 0, 1, 2))
+    early = scheduler.due(datetime.datetime(2022, 11, 20, 23, 58, 59, 999_999))
+
+    assert on_time == [datetime.datetime(2022, 11, 20, 23, 59)]
+    assert late == [
+        datetime.datetime(2022, 11, 20, 23, 59),
+        datetime.datetime(2022, 11, 21, 0, 0),
+        datetime.datetime(2022, 11, 21, 0, 1),
+    ]
+    assert early == []
+
+
+def test_floor_minute() -> None:
+    assert floor_minute(datetime.datetime(2022, 11, 20, 1, 2, 3, 4)) == datetime.datetime(2022, 11, 20, 1, 2)
@@ -0,0 +1,134 @@
+import pytest
+import sqlite3
+import datetime
+from pathlib import Path
+from redqct.lib.storage import Storage, DirectoryStorage, SQLiteStorage, migrate
+
+
+DAY = datetime.date(2022, 11, 20)
+
+
+@pytest.fixture(params=["files", "sqlite"])
+def storage(request, tmp_path: Path) -> Storage:
+    if request.param == "files":
+        return DirectoryStorage(str(tmp_path))
+    return SQLiteStorage(str(tmp_path / "redqct.db"))
+
+
+def reopen(storage: Storage) -> Storage:
+    storage.close()
+    if isinstance(storage, DirectoryStorage):
+        return DirectoryStorage(storage.directory)
+    assert isinstance(storage, SQLiteStorage)
+    return SQLiteStorage(storage.path)
+
+
+def test_storage_round_trip(storage: Storage) -> None:
+    storage.add_member("1", (5, 30))
+    storage.add_member("2", (-3, 0))
+    storage.save_legends({"1": {"osu!": (238, 109, 166), "Neovim": (26, 172, 77)}})
+
+    activity = storage.activity("1", DAY)
+    activity.record(600, 0b11)
+    activity.record(601, 1 << 70)
+    activity.flush()
+    storage.commit()
+
+    storage = reopen(storage)
+    loaded = storage.activity("1", DAY + datetime.timedelta(days=1))
+
+    assert storage.members() == {"1": (5, 30), "2": (-3, 0)}
+    assert list(storage.load_legend("1")) == ["osu!", "Neovim"]
+    assert storage.load_legend("2") == {}
+    assert loaded.day == DAY
+    assert list(loaded.active()) == [(600, 0b11), (601, 1 << 70)]
+
+
+def test_storage_reset_and_remove(storage: Storage) -> None:
+    storage.add_member("1", (0, 0))
+    activity = storage.activity("1", DAY)
+    activity.record(5, 0b1)
+    activity.flush()
+    activity.reset(DAY + datetime.timedelta(days=1))
+    storage.commit()
+
+    assert list(storage.activity("1", DAY).active()) == []
+    assert storage.activity("1", DAY).day == DAY + datetime.timedelta(days=1)
+
+    storage.remove_members(["1"])
+    # Writes for members removed in the meantime are dropped
+    storage.save_legends({"1": {"osu!": (238, 109, 166)}})
+    storage.commit()
+
+    assert reopen(storage).members() == {}
+
+
+def test_migrate_from_directories(tmp_path: Path) -> None:
+    source = DirectoryStorage(str(tmp_path))
+    source.add_member("1", (1, 0))
+    source.save_legends({"1": {"osu!": (238, 109, 166)}})
+    activity = source.activity("1", DAY)
+    activity.record(10, 0b1)
+    activity.flush()
+
+    target = SQLiteStorage(str(tmp_path / "redqct.db"))
+
+    assert migrate(source, target) == 1
+    assert target.members() == {"1": (1, 0)}
+    assert target.load_legend("1") == {"osu!": (238, 109, 166)}
+    assert list(target.activity("1", DAY).active()) == [(10, 0b1)]
+
+
+def test_incomplete_backend_cant_be_created() -> None:
+    class Partial(Storage):
+        def members(self):
+            return {}
+
+    with pytest.raises(TypeError):
+        Partial()  # type: ignore
+
+
+def test_sqlite_legend_updates_leave_yesterday_alone(tmp_path: Path) -> None:
+    storage = SQLiteStorage(str(tmp_path / "redqct.db"))
+    storage.add_member("1", (0, 0))
+    storage.save_yesterday("1", b"png")
+    storage.commit()
+
+    touched = []
+
+    def authorizer(action: int, table: str, *_) -> int:
+        touched.append(table)
+        return sqlite3.SQLITE_OK
+
+    storage.connection.set_authorizer(authorizer)
+    storage.save_legends({"1": {"osu!": (238, 109, 166)}})
+    storage.commit()
+    storage.connection.set_authorizer(None)
+
+    assert "members" in touched
+    assert "yesterday" not in touched
+    assert storage.connection.execute("SELECT png FROM yesterday WHERE member = '1'").fetchone() == (b"png",)
+
+    storage.remove_members(["1"])
+    # Not saved for members who were removed in the meantime
+    storage.save_yesterday("1", b"png")
+    storage.commit()
+
+    assert storage.connection.execute("SELECT COUNT(*) FROM yesterday").fetchone() == (0,)
+
+
+def test_sqlite_moves_yesterday_out_of_old_databases(tmp_path: Path) -> None:
+    path = str(tmp_path / "redqct.db")
+    with sqlite3.connect(path) as old:
+        old.execute(
+            "CREATE TABLE members (id TEXT PRIMARY KEY, h_off INTEGER NOT NULL, m_off INTEGER NOT NULL, "
+            "legend TEXT NOT NULL DEFAULT '{}', day INTEGER, yesterday BLOB)"
+        )
+        old.execute("INSERT INTO members (id, h_off, m_off, yesterday) VALUES ('1', 0, 0, x'89')")
+    old.close()
+
+    storage = SQLiteStorage(path)
+
+    assert storage.members() == {"1": (0, 0)}
+    assert storage.connection.execute("SELECT member, png FROM yesterday").fetchall() == [("1", b"\x89")]
+    assert storage.connection.execute("SELECT yesterday FROM members").fetchall() == [(None,)]
@@ -0,0 +1,74 @@
+import pytest
+import datetime
+from pathlib import Path
+from redqct.lib.store import ActivityStore, MINUTES_PER_DAY
+
+
+@pytest.fixture
+def store(tmp_path: Path) -> ActivityStore:
+    return ActivityStore.create(str(tmp_path / "activity_today.bin"), datetime.date(2022, 11, 20))
+
+
+def test_store_round_trip(store: ActivityStore) -> None:
+    store.record(0, 0b1)
+    store.record(600, 0b101)
+    store.record(600, 0b10)
+    store.record(MINUTES_PER_DAY - 1, 1 << 70)
+    store.flush()
+
+    loaded = ActivityStore.load(store.path)
+
+    assert loaded is not None
+    assert loaded.day == datetime.date(2022, 11, 20)
+    assert list(loaded.active()) == [(0, 0b1), (600, 0b111), (MINUTES_PER_DAY - 1, 1 << 70)]
+
+
+def test_store_ignores_torn_record(store: ActivityStore) -> None:
+    store.record(5, 0b11)
+    store.record(6, 0b11)
+    store.flush()
+
+    with open(store.path, "r+b") as f:
+        f.truncate(Path(store.path).stat().st_size - 1)
+
+    loaded = ActivityStore.load(store.path)
+
+    assert loaded is not None
+    assert list(loaded.active()) == [(5, 0b11)]
+
+
+def test_store_reset(store: ActivityStore) -> None:
+    store.record(5, 0b1)
+    version = store.version
+    store.reset(datetime.date(2022, 11, 21))
+
+    loaded = ActivityStore.load(store.path)
+
+    assert store.version > version
+    assert loaded is not None
+    assert loaded.day == datetime.date(2022, 11, 21)
+    assert list(loaded.active()) == []
+
+
+def test_store_buffers_until_flush(store: ActivityStore) -> None:
+    store.record(5, 0b1)
+
+    unflushed = ActivityStore.load(store.path)
+    store.flush()
+    flushed = ActivityStore.load(store.path)
+
+    assert unflushed is not None and list(unflushed.active()) == []
+    assert flushed is not None and list(flushed.active()) == [(5, 0b1)]
+    assert store.pending == 0
+
+
+def test_store_truncate_drops_unsaved_entries(store: ActivityStore) -> None:
+    store.record(1, 0b1)
+    store.record(2, 0b110)
+    store.flush()
+
+    store.truncate(2)
+    loaded = ActivityStore.load(store.path)
+
+    assert list(store.active()) == [(1, 0b1), (2, 0b10)]
+    assert loaded is not None and list(loaded.active()) == [(1, 0b1), (2, 0b10)]
@@ -0,0 +1,61 @@
+import time
+import asyncio
+import datetime
+from typing import List
+from redqct.lib.tick import TickRunner
+
+
+def test_ticks_are_coalesced() -> None:
+    seen: List[List[datetime.datetime]] = []
+    start = datetime.datetime(2022, 11, 20, 12, 0)
+
+    def make_jobs(minutes: List[datetime.datetime]):
+        seen.append(list(minutes))
+        return [lambda: time.sleep(0.05) for _ in range(4)]
+
+    async def main() -> TickRunner:
+        runner = TickRunner(workers=2)
+        for i in range(3):
+            runner.submit([start + datetime.timedelta(minutes=i)], make_jobs)
+        assert runner.task
+        await runner.task
+        return runner
+
+    runner = asyncio.run(main())
+
+    assert seen == [[start], [start + datetime.timedelta(minutes=1), start + datetime.timedelta(minutes=2)]]
+    assert runner.ticks == 2
+    assert runner.coalesced == 2
+    assert runner.overruns == 0
+
+
+def test_failing_job_is_isolated() -> None:
+    ran: List[int] = []
+
+    def fail() -> None:
+        raise RuntimeError("slow disk")
+
+    async def main() -> TickRunner:
+        runner = TickRunner(workers=2)
+        await runner.run([datetime.datetime(2022, 11, 20)], lambda _: [fail, lambda: ran.append(1)])
+        return runner
+
+    runner = asyncio.run(main())
+
+    assert ran == [1]
+    assert runner.failures == 1
+
+
+def test_no_ticks_after_shutdown() -> None:
+    seen: List[List[datetime.datetime]] = []
+
+    async def main() -> TickRunner:
+        runner = TickRunner(workers=2)
+        runner.shutdown()
+        runner.submit([datetime.datetime(2022, 11, 20)], lambda minutes: seen.append(minutes) or [])
+        return runner
+
+    runner = asyncio.run(main())
+
+    assert runner.task is None
+    assert seen == []
@@ -0,0 +1,133 @@
+import os
+import pytest
+import datetime
+from pathlib import Path
+
+os.environ.setdefault("BOT_GUILD", "1")
+
+from redqct.lib.store import ActivityStore
+from redqct.lib.storage import DirectoryStorage
+from redqct.fakes import FakeClient
+from redqct.lib import track
+from redqct.lib.track import Users_, BOT_GUILD, DISTINCTS, FLUSH_EVERY, PRESETS
+
+
+@pytest.fixture
+def users(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Users_:
+    # Users_ is a singleton, so start each test with a fresh one
+    monkeypatch.setattr(Users_, "_instance", None)
+    return Users_(bot=FakeClient(BOT_GUILD, [1]), storage=DirectoryStorage(str(tmp_path)))
+
+
+def test_close_flushes_buffered_activity(users: Users_, tmp_path: Path) -> None:
+    users.track("1", 0, 0)
+    tracked = users.users["1"]
+    noon = datetime.datetime.combine(datetime.datetime.utcnow().date(), datetime.time(12))
+    minutes = [noon + datetime.timedelta(minutes=i) for i in range(FLUSH_EVERY - 1)]
+
+    tracked.tick(minutes[:1], ["osu!"], True)
+    # Unchanged, so these stay buffered
+    for minute in minutes[1:]:
+        tracked.tick([minute], ["osu!"], False)
+    assert tracked.store.pending == FLUSH_EVERY - 2
+
+    users.close()
+
+    store = ActivityStore.load(str(tmp_path / "1" / "activity_today.bin"))
+    assert store
+    assert [minute for minute, _ in store.active()] == list(range(720, 720 + FLUSH_EVERY - 1))
+
+
+def test_untrack_stops_queued_ticks(users: Users_, tmp_path: Path) -> None:
+    users.track("1", 0, 0)
+    users.users["1"].set_activities(["osu!"])
+    jobs = users.prepare_tick([datetime.datetime.utcnow()])
+
+    users.untrack(1)
+    # A job prepared before the member left runs afterwards
+    for job in jobs:
+        job()
+    users.commit()
+
+    assert not (tmp_path / "1").exists()
+    assert users.storage.members() == {}
+
+
+def test_untracked_member_has_no_graph(users: Users_, tmp_path: Path) -> None:
+    users.track("1", 0, 0)
+    users.users.clear()
+    users.load_existing()
+    # Still lazy, as when $graph picks them up just before they leave
+    tracked = users.users["1"]
+
+    users.untrack(1)
+
+    assert tracked.graph_png() is None
+    assert not (tmp_path / "1").exists()
+
+
+def test_retracked_member_gets_a_fresh_graph(users: Users_) -> None:
+    noon = datetime.datetime.combine(datetime.datetime.utcnow().date(), datetime.time(12))
+
+    users.track("1", 0, 0)
+    users.users["1"].tick([noon], ["osu!"], True)
+    before = users.users["1"].graph_png()
+
+    users.untrack(1)
+    users.track("1", 0, 0)
+    # Leaves the new store at the same version the old one had
+    users.users["1"].tick([noon], ["Neovim"], True)
+
+    assert users.users["1"].graph_png() != before
+
+
+def test_load_existing_only_runs_once(users: Users_) -> None:
+    users.track("1", 0, 0)
+    users.users.clear()
+
+    users.load_existing()
+    tracked = users.users["1"]
+    # e.g. on_ready firing again after a reconnect
+    users.load_existing()
+
+    assert users.users["1"] is tracked
+
+
+def test_free_colour_assignment(users: Users_, monkeypatch: pytest.MonkeyPatch) -> None:
+    # A preset that happens to be one of the pastel colours as well
+    monkeypatch.setitem(PRESETS, "Both", DISTINCTS[1])
+    users.track("1", 0, 0)
+    tracked = users.users["1"]
+
+    tracked.check_new_entry("osu!")
+    tracked.check_new_entry("a")
+    tracked.check_new_entry("Both")
+    tracked.check_new_entry("b")
+
+    assert tracked.legend == {
+        "osu!": PRESETS["osu!"],
+        "a": DISTINCTS[0],
+        "Both": DISTINCTS[1],
+        "b": DISTINCTS[2],
+    }
+
+    # Presets are used even when the pastel colour was taken first
+    tracked.check_new_entry("c")
+    monkeypatch.setitem(PRESETS, "Late", DISTINCTS[3])
+    tracked.check_new_entry("Late")
+    assert tracked.legend["c"] == tracked.legend["Late"] == DISTINCTS[3]
+
+    for i in range(len(DISTINCTS) - 4):
+        tracked.check_new_entry(f"filler {i}")
+    assert set(tracked.legend.values()) >= set(DISTINCTS)
+
+    # Out of pastel colours, so random ones are drawn until one isn't taken
+    draws = iter([*DISTINCTS[0], 1, 2, 3])
+    monkeypatch.setattr(track.random, "randrange", lambda *_: next(draws))
+    tracked.check_new_entry("d")
+    assert tracked.legend["d"] == (1, 2, 3)
+
+    # The legend starts over at midnight, and so do the colours
+    tracked.check_clear(datetime.datetime.utcnow() + datetime.timedelta(days=1))
+    tracked.check_new_entry("e")
+    assert tracked.legend == {"e": DISTINCTS[0]}